@@ -0,0 +1,267 @@
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+# files of the fake stage announce the number of paragraphs semantha should "find" in them
+PARAGRAPH_MARKER = "bench-paragraphs="
+
+__WORDS = ("emission scope supplier governance climate water waste diversity board policy risk energy report target "
+           "biodiversity social employee safety privacy data disclosure taxonomy transition carbon neutral").split()
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(__WORDS) for _ in range(words)).capitalize() + "."
+
+
+def _text(rng: random.Random, sentences: int = 3) -> str:
+    return " ".join(_sentence(rng, rng.randint(8, 16)) for _ in range(sentences))
+
+
+# local stand-in for the semantha platform server with the endpoints used by the app, deterministic payloads and an
+# injectable latency per request
+class FakeSemanthaServer:
+    __PARAGRAPHS_PER_CONTENT = 4
+    __CONTENTS_PER_PAGE = 3
+
+    def __init__(self, library_size: int = 200, library_paragraphs: int = 20, tag_count: int = 12,
+                 match_ratio: float = 0.3, latency: float = 0.0, compare_latency: float = 0.0, seed: int = 42):
+        self.__library_paragraphs = library_paragraphs
+        self.__match_ratio = match_ratio
+        self.__latency = latency
+        self.__compare_latency = compare_latency
+        self.__seed = seed
+        self.__tags = [f"Topic {i}" for i in range(tag_count)]
+        self.__classes = self.__build_classes()
+        self.__library = self.__build_library(library_size)
+        self.__library_by_id = {d["id"]: d for d in self.__library}
+        self.__calls = Counter()
+        self.__lock = threading.Lock()
+        self.__server = ThreadingHTTPServer(("127.0.0.1", 0), self.__handler())
+        self.__server.daemon_threads = True
+        self.__thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.__server.server_address[1]}"
+
+    def start(self) -> "FakeSemanthaServer":
+        self.__thread = threading.Thread(target=self.__server.serve_forever, daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def get_calls(self) -> Dict[str, int]:
+        with self.__lock:
+            return dict(self.__calls)
+
+    def reset_calls(self):
+        with self.__lock:
+            self.__calls.clear()
+
+    def update_library_document(self, doc_id: str):
+        # changes the library fingerprint (count and latest update) like an edit in semantha
+        with self.__lock:
+            self.__library_by_id[doc_id]["updated"] = max(d["updated"] for d in self.__library) + 1
+
+    def __count(self, route: str):
+        with self.__lock:
+            self.__calls[route] += 1
+
+    def __build_classes(self) -> List[dict]:
+        __roots = []
+        for i in range(3):
+            __root_id = f"class-{i}"
+            __roots.append({
+                "id": __root_id,
+                "name": f"Area {i}",
+                "subClasses": [
+                    {"id": f"{__root_id}-{j}", "name": f"Area {i}.{j}", "parentId": __root_id} for j in range(3)
+                ]
+            })
+        return __roots
+
+    def __build_library(self, size: int) -> List[dict]:
+        __rng = random.Random(self.__seed)
+        __leaves = [c for root in self.__classes for c in root["subClasses"]]
+        __library = []
+        for i in range(size):
+            __class = __rng.choice(__leaves)
+            __library.append({
+                "id": f"lib-{i}",
+                "name": f"Regulation {i}",
+                "tags": __rng.sample(self.__tags, __rng.randint(1, 2)),
+                "derivedTags": [],
+                "documentClass": {"id": __class["id"], "name": __class["name"]},
+                "contentPreview": _text(__rng, 1),
+                "created": 1600000000 + i,
+                "updated": 1600000000 + i
+            })
+        return __library
+
+    def __library_document(self, doc_id: str) -> Optional[dict]:
+        if doc_id not in self.__library_by_id:
+            return None
+        __rng = random.Random(f"{self.__seed}|{doc_id}")
+        __paragraphs = [
+            {"id": f"{doc_id}-p{j}", "text": _text(__rng), "type": "text"} for j in range(self.__library_paragraphs)
+        ]
+        return dict(self.__library_by_id[doc_id], pages=self.__paginate(__paragraphs))
+
+    def __library_paragraph(self, doc_id: str, par_id: str) -> Optional[dict]:
+        __doc = self.__library_document(doc_id)
+        if __doc is None:
+            return None
+        for page in __doc["pages"]:
+            for content in page["contents"]:
+                for p in content["paragraphs"]:
+                    if p["id"] == par_id:
+                        return p
+        return None
+
+    def __compared_document(self, content: bytes, threshold: float, max_references: int) -> dict:
+        __marker = re.search(re.escape(PARAGRAPH_MARKER).encode() + rb"(\d+)", content)
+        __paragraph_count = int(__marker.group(1)) if __marker else 50
+        __doc_id = hashlib.sha256(content).hexdigest()[:16]
+        __rng = random.Random(f"{self.__seed}|{__doc_id}")
+        __paragraphs = []
+        for j in range(__paragraph_count):
+            __paragraph = {"id": f"{__doc_id}-p{j}", "text": _text(__rng), "type": "text"}
+            if __rng.random() < self.__match_ratio:
+                __references = []
+                for _ in range(__rng.randint(1, max_references)):
+                    __lib_doc = __rng.choice(self.__library)
+                    __references.append({
+                        "documentId": __lib_doc["id"],
+                        "documentName": __lib_doc["name"],
+                        "paragraphId": f"{__lib_doc['id']}-p{__rng.randrange(self.__library_paragraphs)}",
+                        "similarity": round(__rng.uniform(threshold, 1.0), 4)
+                    })
+                __references.sort(key=lambda r: -r["similarity"])
+                __paragraph["references"] = __references
+            __paragraphs.append(__paragraph)
+        return {"id": __doc_id, "name": f"document-{__doc_id}", "pages": self.__paginate(__paragraphs)}
+
+    def __paginate(self, paragraphs: List[dict]) -> List[dict]:
+        __per_page = self.__PARAGRAPHS_PER_CONTENT * self.__CONTENTS_PER_PAGE
+        __pages = []
+        for start in range(0, len(paragraphs), __per_page):
+            __page_paragraphs = paragraphs[start:start + __per_page]
+            __pages.append({"contents": [
+                {"paragraphs": __page_paragraphs[c:c + self.__PARAGRAPHS_PER_CONTENT]}
+                for c in range(0, len(__page_paragraphs), self.__PARAGRAPHS_PER_CONTENT)
+            ]})
+        return __pages
+
+    def __answer(self, question: str) -> dict:
+        __rng = random.Random(f"{self.__seed}|{question}")
+        __references = __rng.sample(self.__library, min(5, len(self.__library)))
+        return {
+            "answer": f"{_text(__rng, 4)} [1] [2]\nReferences: [1] {__references[0]['name']}",
+            "references": [
+                {"id": d["id"], "name": d["name"], "content": _text(__rng, 2)} for d in __references
+            ]
+        }
+
+    def __summary(self, topic: str, text_count: int) -> str:
+        __rng = random.Random(f"{self.__seed}|{topic}|{text_count}")
+        return f"{_text(__rng, 5)} [1]\nReferences: [1] ..."
+
+    def __list_library(self, query: Dict[str, List[str]]) -> dict:
+        __docs = self.__library
+        if query.get("sort", [""])[0] == "-updated":
+            __docs = sorted(__docs, key=lambda d: -d["updated"])
+        __offset = int(query.get("offset", ["0"])[0])
+        __limit = int(query.get("limit", [str(len(__docs))])[0])
+        __slice = __docs[__offset:__offset + __limit]
+        return {
+            "meta": {"page": {"from": __offset, "to": __offset + len(__slice), "total": len(__docs)}},
+            "data": __slice
+        }
+
+    def __route(self, method: str, path: str, query: Dict[str, List[str]], body: bytes):
+        # returns (route name, payload), payload None for unknown resources
+        if path.endswith("/api/info"):
+            return "info", {"title": "semantha (benchmark)", "version": "bench"}
+        __match = re.search(r"/domains/[^/]+/(.*)$", path)
+        __resource = __match.group(1).strip("/") if __match else ""
+        __parts = __resource.split("/")
+        if method == "POST" and __resource == "references":
+            time.sleep(self.__compare_latency)
+            __threshold = float(self.__form_field(body, "similaritythreshold") or 0.0)
+            __max_references = int(query.get("maxreferences", ["1"])[0])
+            return "references", self.__compared_document(body, __threshold, __max_references)
+        if method == "POST" and __resource == "answers":
+            return "answers", self.__answer(self.__form_field(body, "question") or "")
+        if method == "POST" and __resource == "summarizations":
+            return "summarizations", self.__summary(
+                self.__form_field(body, "topic") or "", body.count(b'name="texts"')
+            )
+        if method != "GET":
+            return "unknown", None
+        if __resource == "tags":
+            return "tags", self.__tags
+        if __resource == "documentclasses":
+            return "documentclasses", self.__classes
+        if __parts[0] == "documentclasses" and len(__parts) == 2:
+            __classes = [c for root in self.__classes for c in [root] + root["subClasses"]]
+            return "documentclass", next((c for c in __classes if c["id"] == __parts[1]), None)
+        if __resource == "referencedocuments":
+            return "referencedocuments", self.__list_library(query)
+        if __parts[0] == "referencedocuments" and len(__parts) == 2:
+            return "referencedocument", self.__library_document(__parts[1])
+        if __parts[0] == "referencedocuments" and len(__parts) == 4 and __parts[2] == "paragraphs":
+            return "paragraph", self.__library_paragraph(__parts[1], __parts[3])
+        return "unknown", None
+
+    @staticmethod
+    def __form_field(body: bytes, name: str) -> Optional[str]:
+        __match = re.search(rb'name="' + name.encode() + rb'"\r\n\r\n(.*?)\r\n--', body, re.DOTALL)
+        return __match.group(1).decode("utf-8") if __match else None
+
+    def __handle(self, method: str, raw_path: str, body: bytes):
+        __url = urlparse(raw_path)
+        time.sleep(self.__latency)
+        __route, __payload = self.__route(method, __url.path, parse_qs(__url.query), body)
+        self.__count(f"{method} {__route}")
+        if __payload is None:
+            return 404, "text/plain", b"not found"
+        if isinstance(__payload, str):
+            return 200, "text/plain", __payload.encode("utf-8")
+        return 200, "application/json", json.dumps(__payload).encode("utf-8")
+
+    def __handler(self):
+        handle = self.__handle
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                self._respond("GET")
+
+            def do_POST(self):
+                self._respond("POST")
+
+            def _respond(self, method: str):
+                status, content_type, content = handle(
+                    method, self.path, self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                )
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
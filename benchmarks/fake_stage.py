@@ -0,0 +1,87 @@
+import hashlib
+import os
+import threading
+import time
+from collections import Counter
+from io import BytesIO
+from typing import Dict, Iterable
+
+import pandas as pd
+
+from fake_semantha import PARAGRAPH_MARKER
+
+
+# stand-in for SnowparkConnector with generated files and an injectable latency per stage operation
+class FakeStage:
+    __SORT_COLUMNS = {
+        "name": "RELATIVE_PATH",
+        "size": "SIZE",
+        "last_modified": "LAST_MODIFIED"
+    }
+
+    def __init__(self, file_count: int, paragraphs_per_file: int, file_size: int = 256 * 1024,
+                 latency: float = 0.0, extension: str = ".pdf"):
+        self.__latency = latency
+        self.__files = {}
+        for i in range(file_count):
+            __content = self.__content(i, paragraphs_per_file, file_size)
+            self.__files[f"reports/report_{i:04d}{extension}"] = __content
+        self.__listing = pd.DataFrame({
+            "RELATIVE_PATH": list(self.__files),
+            "SIZE": [len(c) for c in self.__files.values()],
+            "LAST_MODIFIED": [pd.Timestamp("2023-06-01") + pd.Timedelta(minutes=i) for i in range(file_count)],
+            "MD5": [hashlib.md5(c).hexdigest() for c in self.__files.values()]
+        })
+        self.__calls = Counter()
+        self.__lock = threading.Lock()
+
+    def get_calls(self) -> Dict[str, int]:
+        with self.__lock:
+            return dict(self.__calls)
+
+    def reset_calls(self):
+        with self.__lock:
+            self.__calls.clear()
+
+    def get_document(self, doc_name: str, md5: str = None, last_modified=None):
+        self.__count("get_document")
+        time.sleep(self.__latency)
+        __stream = BytesIO(self.__files[doc_name])
+        __stream.name = os.path.basename(doc_name)
+        return __stream
+
+    def get_list_of_file_names(self, limit: int = 20):
+        return self.list_files(limit=limit)["RELATIVE_PATH"].values.tolist()
+
+    def list_files(self, extensions: Iterable[str] = (), search: str = None, order_by: str = "name",
+                   descending: bool = False, limit: int = 20, offset: int = 0) -> pd.DataFrame:
+        self.__count("list_files")
+        time.sleep(self.__latency)
+        __files = self.__filter(extensions, search).sort_values(
+            [self.__SORT_COLUMNS[order_by], "RELATIVE_PATH"], ascending=not descending
+        )
+        return __files.iloc[offset:offset + limit].reset_index(drop=True)
+
+    def count_files(self, extensions: Iterable[str] = (), search: str = None) -> int:
+        self.__count("count_files")
+        time.sleep(self.__latency)
+        return len(self.__filter(extensions, search))
+
+    def __filter(self, extensions: Iterable[str], search: str) -> pd.DataFrame:
+        __paths = self.__listing["RELATIVE_PATH"].str.lower()
+        __mask = pd.Series(True, index=self.__listing.index)
+        __extensions = tuple(e.lower() for e in extensions)
+        if len(__extensions) > 0:
+            __mask &= __paths.str.endswith(__extensions)
+        if search:
+            __mask &= __paths.str.contains(search.lower(), regex=False)
+        return self.__listing[__mask]
+
+    def __count(self, operation: str):
+        with self.__lock:
+            self.__calls[operation] += 1
+
+    @staticmethod
+    def __content(idx: int, paragraphs: int, size: int) -> bytes:
+        __header = f"{PARAGRAPH_MARKER}{paragraphs}\nreport {idx}\n".encode("utf-8")
+        return __header + b"\0" * max(0, size - len(__header))
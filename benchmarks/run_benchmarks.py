@@ -0,0 +1,241 @@
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import streamlit as st  # noqa: E402
+from streamlit.logger import set_log_level  # noqa: E402
+from streamlit.runtime.scriptrunner import ScriptRunContext, add_script_run_ctx  # noqa: E402
+from streamlit.runtime.state import SafeSessionState, SessionState  # noqa: E402
+from streamlit.runtime.uploaded_file_manager import UploadedFileManager  # noqa: E402
+
+import state  # noqa: E402
+from fake_semantha import FakeSemanthaServer  # noqa: E402
+from fake_stage import FakeStage  # noqa: E402
+from pages_views.compare import ComparePage  # noqa: E402
+from pages_views.document_collection import DocumentCollection, FileDocument  # noqa: E402
+from pages_views.rag import RetrievalAugmentedGeneration  # noqa: E402
+from semantha import AsyncSemanthaConnector, SemanthaConnector  # noqa: E402
+from util.analysis_store import AnalysisStore  # noqa: E402
+
+__QUESTION = "What do we have to be careful of concerning personal data?"
+
+
+@contextmanager
+def _script_run_context():
+    # the pages need session state and widgets, the produced ui messages are only counted
+    __messages = []
+    __ctx = ScriptRunContext(
+        session_id="benchmark",
+        _enqueue=__messages.append,
+        query_string="",
+        session_state=SafeSessionState(SessionState()),
+        uploaded_file_mgr=UploadedFileManager(),
+        page_script_hash="",
+        user_info={"email": None}
+    )
+    add_script_run_ctx(threading.current_thread(), __ctx)
+    try:
+        yield __messages
+    finally:
+        add_script_run_ctx(threading.current_thread(), None)
+
+
+class _Backends:
+
+    def __init__(self, server: FakeSemanthaServer, pool_size: int):
+        self.__server = server
+        self.__pool_size = pool_size
+        self.__stage = None
+
+    def connect(self, stage: FakeStage = None, store: AnalysisStore = None) -> SemanthaConnector:
+        # every repetition starts with empty connector caches, the pages get the connectors through 'state'
+        __connector = SemanthaConnector(self.__server.url, "benchmark", "benchmark", pool_size=self.__pool_size)
+        __async_connector = AsyncSemanthaConnector(__connector, self.__pool_size)
+        self.__stage = stage
+        state.get_semantha = lambda: __connector
+        state.get_semantha_async = lambda: __async_connector
+        state.get_snowpark = lambda: self.__stage
+        state.get_analysis_store = lambda: store
+        state.get_analysis_scope = lambda: "benchmark"
+        st.cache_data.clear()
+        return __connector
+
+    def measure(self, fn: Callable[[], None]) -> Dict:
+        self.__server.reset_calls()
+        if self.__stage is not None:
+            self.__stage.reset_calls()
+        __start = time.perf_counter()
+        fn()
+        __wall = time.perf_counter() - __start
+        return {
+            "wall": __wall,
+            "semantha_calls": self.__server.get_calls(),
+            "stage_calls": self.__stage.get_calls() if self.__stage is not None else {}
+        }
+
+
+def _summarize(scenario: str, params: Dict, runs: List[Dict]) -> Dict:
+    __walls = [r["wall"] for r in runs]
+    return {
+        "scenario": scenario,
+        "params": params,
+        "wall_median": statistics.median(__walls),
+        "wall_min": min(__walls),
+        # call counts are the same for every repetition as each one starts with empty caches
+        "semantha_calls": runs[-1]["semantha_calls"],
+        "stage_calls": runs[-1]["stage_calls"],
+        "ui_messages": runs[-1].get("ui_messages", 0)
+    }
+
+
+def _compare_page(backends: _Backends, doc_size: int, threshold: float, repeat: int) -> Dict:
+    __stage = FakeStage(1, doc_size)
+    __path = __stage.list_files(limit=1)["RELATIVE_PATH"][0]
+    __runs = []
+    for _ in range(repeat):
+        with _script_run_context() as messages:
+            __connector = backends.connect(__stage)
+            __doc = __connector.compare_to_library(__stage.get_document(__path), threshold)
+            state.set_single_document_with_references(os.path.basename(__path), __doc)
+            __page = ComparePage(2)
+            __run = backends.measure(__page.display_page)
+            __run["ui_messages"] = len(messages)
+            __runs.append(__run)
+    return _summarize("compare_page", {"paragraphs": doc_size}, __runs)
+
+
+def _document_collection(backends: _Backends, collection_size: int, doc_size: int, threshold: float, workers: int,
+                         stage_latency: float, repeat: int) -> List[Dict]:
+    __stage = FakeStage(collection_size, doc_size, latency=stage_latency)
+    __analysis_runs = []
+    __summary_runs = []
+    __reanalysis_runs = []
+    for _ in range(repeat):
+        with _script_run_context() as messages, tempfile.TemporaryDirectory() as store_dir:
+            backends.connect(__stage, AnalysisStore(store_dir, 1024 * 1024 * 1024))
+            state.set_similarity_threshold(threshold)
+            __files = [
+                FileDocument(f.RELATIVE_PATH, size=f.SIZE, last_modified=f.LAST_MODIFIED, md5=f.MD5)
+                for f in __stage.list_files(limit=collection_size).itertuples()
+            ]
+            __page = DocumentCollection(3)
+            __run = backends.measure(lambda: __page._DocumentCollection__analyze_doc_collection(__files, workers))
+            __run["ui_messages"] = len(messages)
+            __analysis_runs.append(__run)
+
+            __tags = Counter(
+                v["tag"] for refs in state.get_docs_with_refs_with_tags().values() for r in refs for v in r.values()
+            )
+            if len(__tags) > 0:
+                __messages_before = len(messages)
+                __run = backends.measure(
+                    lambda: __page._DocumentCollection__display_summarization(__tags.most_common(1)[0][0])
+                )
+                __run["ui_messages"] = len(messages) - __messages_before
+                __summary_runs.append(__run)
+
+            # unchanged stage, the stored results are reused
+            __messages_before = len(messages)
+            __run = backends.measure(lambda: __page._DocumentCollection__analyze_doc_collection(__files, workers))
+            __run["ui_messages"] = len(messages) - __messages_before
+            __reanalysis_runs.append(__run)
+    __params = {"documents": collection_size, "paragraphs": doc_size, "workers": workers}
+    __results = [_summarize("collection_analysis", __params, __analysis_runs)]
+    if len(__summary_runs) > 0:
+        __results.append(_summarize("summarization", __params, __summary_runs))
+    __results.append(_summarize("collection_reanalysis", __params, __reanalysis_runs))
+    return __results
+
+
+def _rag(backends: _Backends, repeat: int) -> Dict:
+    __runs = []
+    for _ in range(repeat):
+        with _script_run_context() as messages:
+            backends.connect()
+            st.session_state["rag_question"] = __QUESTION
+            __page = RetrievalAugmentedGeneration(4)
+            __run = backends.measure(__page.display_page)
+            __run["ui_messages"] = len(messages)
+            __runs.append(__run)
+    return _summarize("rag", {}, __runs)
+
+
+def _format_calls(calls: Dict[str, int]) -> str:
+    return ", ".join(f"{k}={v}" for k, v in sorted(calls.items())) or "-"
+
+
+def _print_report(results: List[Dict]):
+    print(f"{'scenario':<22}{'parameters':<40}{'median s':>10}{'min s':>10}{'calls':>7}  backend calls")
+    for r in results:
+        __params = " ".join(f"{k}={v}" for k, v in r["params"].items()) or "-"
+        __total = sum(r["semantha_calls"].values()) + sum(r["stage_calls"].values())
+        print(f"{r['scenario']:<22}{__params:<40}{r['wall_median']:>10.3f}{r['wall_min']:>10.3f}{__total:>7}  "
+              f"semantha: {_format_calls(r['semantha_calls'])}; stage: {_format_calls(r['stage_calls'])}")
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def main():
+    __parser = argparse.ArgumentParser(description="Benchmarks the main paths of the app against local stand-ins "
+                                                   "for semantha and the Snowflake stage.")
+    __parser.add_argument("--doc-sizes", type=_int_list, default=[50, 200, 800],
+                          help="paragraphs per compared document (comma separated)")
+    __parser.add_argument("--collection-sizes", type=_int_list, default=[5, 20],
+                          help="documents per analyzed collection (comma separated)")
+    __parser.add_argument("--collection-doc-size", type=int, default=100, help="paragraphs per collection document")
+    __parser.add_argument("--threshold", type=float, default=0.7)
+    __parser.add_argument("--workers", type=int, default=4, help="parallel comparisons of the collection analysis")
+    __parser.add_argument("--latency", type=float, default=0.02, help="semantha latency per request in seconds")
+    __parser.add_argument("--compare-latency", type=float, default=0.2,
+                          help="additional semantha latency per comparison in seconds")
+    __parser.add_argument("--stage-latency", type=float, default=0.01, help="stage latency per operation in seconds")
+    __parser.add_argument("--library-size", type=int, default=200)
+    __parser.add_argument("--pool-size", type=int, default=10)
+    __parser.add_argument("--repeat", type=int, default=3)
+    __parser.add_argument("--scenarios", default="compare,collection,rag",
+                          help="comma separated subset of compare, collection and rag")
+    __parser.add_argument("--json", help="also write the results to this file")
+    __args = __parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    set_log_level("error")
+    __scenarios = set(__args.scenarios.split(","))
+    __server = FakeSemanthaServer(library_size=__args.library_size, latency=__args.latency,
+                                  compare_latency=__args.compare_latency).start()
+    __backends = _Backends(__server, __args.pool_size)
+    __results = []
+    try:
+        if "compare" in __scenarios:
+            for doc_size in __args.doc_sizes:
+                __results.append(_compare_page(__backends, doc_size, __args.threshold, __args.repeat))
+        if "collection" in __scenarios:
+            for collection_size in __args.collection_sizes:
+                __results.extend(_document_collection(
+                    __backends, collection_size, __args.collection_doc_size, __args.threshold, __args.workers,
+                    __args.stage_latency, __args.repeat
+                ))
+        if "rag" in __scenarios:
+            __results.append(_rag(__backends, __args.repeat))
+    finally:
+        __server.stop()
+    _print_report(__results)
+    if __args.json:
+        with open(__args.json, "w") as f:
+            json.dump(__results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
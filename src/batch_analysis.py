@@ -0,0 +1,227 @@
+import argparse
+import logging
+import os
+import sys
+from io import BytesIO
+from multiprocessing import Pool
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import toml
+
+import state
+from semantha import SemanthaConnector
+from snowpark_connection import SnowparkConnector
+from util.analysis_store import AnalysisStore, analysis_parameters, analysis_scope
+from util.file_types import ANALYZABLE_EXTENSIONS, is_analyzable
+from util.semantha_model_handling import CompactDocument, get_match_table
+
+PARQUET_SCHEMA = pa.schema([
+    ("path", pa.string()),
+    ("md5", pa.string()),
+    ("last_modified", pa.string()),
+    ("match", pa.int32()),
+    ("page", pa.int32()),
+    ("paragraph_id", pa.string()),
+    ("text", pa.string()),
+    ("rank", pa.int16()),
+    ("document_id", pa.string()),
+    ("ref_paragraph_id", pa.string()),
+    ("similarity", pa.float64()),
+    ("tags", pa.list_(pa.string()))
+])
+
+__LISTING_PAGE_SIZE = 1000
+__MANIFEST_SAVE_INTERVAL = 50
+
+# connectors of a worker process, created once by _init_worker
+_worker = {}
+
+
+class AnalysisTask(NamedTuple):
+    path: str
+    md5: Optional[str] = None
+    last_modified: Optional[str] = None
+    local: bool = False
+
+
+def _connect_semantha(settings: Dict) -> SemanthaConnector:
+    __semantha = settings["semantha"]
+    return SemanthaConnector(__semantha["server_url"], __semantha["api_key"], __semantha["domain"],
+                             state.create_disk_cache(settings.get("cache", {}), "results",
+                                                     state.DEFAULT_RESULT_CACHE_MAX_BYTES),
+                             int(__semantha.get("pool_size", state.DEFAULT_SEMANTHA_POOL_SIZE)),
+                             int(__semantha.get("cache_max_bytes", state.DEFAULT_SEMANTHA_CACHE_MAX_BYTES)),
+                             split_pages=int(__semantha.get("split_pages", 0)))
+
+
+def _connect_snowpark(settings: Dict) -> SnowparkConnector:
+    __download_cache = state.create_disk_cache(settings.get("cache", {}), "downloads",
+                                               state.DEFAULT_DOWNLOAD_CACHE_MAX_BYTES)
+    return SnowparkConnector(download_cache=__download_cache, **dict(settings["snowflake"]))
+
+
+def _init_worker(settings: Dict, threshold: float, max_references: int, use_stage: bool):
+    _worker["semantha"] = _connect_semantha(settings)
+    _worker["snowpark"] = _connect_snowpark(settings) if use_stage else None
+    _worker["threshold"] = threshold
+    _worker["max_references"] = max_references
+
+
+def _open(task: AnalysisTask):
+    if not task.local:
+        return _worker["snowpark"].get_document(task.path, task.md5, task.last_modified)
+    with open(task.path, "rb") as f:
+        __stream = BytesIO(f.read())
+    __stream.name = os.path.basename(task.path)
+    return __stream
+
+
+def _analyze(task: AnalysisTask) \
+        -> Tuple[AnalysisTask, Optional[CompactDocument], Optional[pd.DataFrame], Optional[str]]:
+    try:
+        __semantha = _worker["semantha"]
+        __doc = CompactDocument.from_document(
+            __semantha.compare_to_library(_open(task), _worker["threshold"], _worker["max_references"])
+        )
+        __matches = get_match_table(__doc, __semantha.get_tags_of_library_document, state.NO_TAG)
+        return task, __doc, _to_output_rows(task, __matches), None
+    except Exception as e:
+        logging.exception(f"Analyzing '{task.path}' failed")
+        return task, None, None, f"{type(e).__name__}: {e}"
+
+
+def _to_output_rows(task: AnalysisTask, matches: pd.DataFrame) -> pd.DataFrame:
+    __rows = matches.assign(
+        document_id=matches["document_id"].astype(str),
+        tags=matches["tags"].map(list)
+    )
+    __rows.insert(0, "path", task.path)
+    __rows.insert(1, "md5", task.md5)
+    __rows.insert(2, "last_modified", task.last_modified)
+    return __rows[PARQUET_SCHEMA.names]
+
+
+def list_stage_tasks(snowpark: SnowparkConnector, search: str = None, limit: int = None) -> Iterator[AnalysisTask]:
+    __offset = 0
+    while limit is None or __offset < limit:
+        __page_size = __LISTING_PAGE_SIZE if limit is None else min(__LISTING_PAGE_SIZE, limit - __offset)
+        __files = snowpark.list_files(ANALYZABLE_EXTENSIONS, search, limit=__page_size, offset=__offset)
+        for f in __files.itertuples():
+            yield AnalysisTask(f.RELATIVE_PATH, f.MD5, str(f.LAST_MODIFIED))
+        __offset += len(__files)
+        if len(__files) < __page_size:
+            break
+
+
+def list_directory_tasks(directory: str, search: str = None, limit: int = None) -> Iterator[AnalysisTask]:
+    __count = 0
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            if limit is not None and __count >= limit:
+                return
+            __path = os.path.join(root, name)
+            if not is_analyzable(__path) or (search and search.lower() not in __path.lower()):
+                continue
+            __count += 1
+            yield AnalysisTask(__path, last_modified=str(pd.Timestamp(os.path.getmtime(__path), unit="s")), local=True)
+
+
+def run_batch_analysis(settings: Dict, tasks: List[AnalysisTask], output: str, threshold: float,
+                       max_references: int = 1, workers: int = 4, store: AnalysisStore = None,
+                       scope: str = None) -> List[Tuple[AnalysisTask, str]]:
+    # the matches of every document are appended to the Parquet file as soon as its analysis is done, with a store
+    # only new or changed documents are compared again
+    __semantha = None
+    __parameters = None
+    __stored = {}
+    if store is not None:
+        __semantha = _connect_semantha(settings)
+        __parameters = analysis_parameters(threshold, max_references, __semantha.split_pages,
+                                           __semantha.get_library_fingerprint())
+        for task in tasks:
+            if store.is_versioned(task.md5, task.last_modified):
+                __doc = store.get(scope, task.path, task.md5, task.last_modified, __parameters)
+                if __doc is not None:
+                    __stored[task.path] = __doc
+    __pending = [t for t in tasks if t.path not in __stored]
+    __use_stage = any(not t.local for t in __pending)
+    __failed = []
+    __match_count = 0
+    with pq.ParquetWriter(output, PARQUET_SCHEMA) as writer:
+        if len(__stored) > 0:
+            logging.info(f"Reusing the results of {len(__stored)} unchanged documents")
+            for task in tasks:
+                if task.path in __stored:
+                    __matches = get_match_table(__stored[task.path], __semantha.get_tags_of_library_document,
+                                                state.NO_TAG)
+                    writer.write_table(pa.Table.from_pandas(
+                        _to_output_rows(task, __matches), schema=PARQUET_SCHEMA, preserve_index=False
+                    ))
+                    __match_count += len(__matches)
+        if len(__pending) > 0:
+            logging.info(f"Analyzing {len(__pending)} new or changed documents with {workers} workers")
+            with Pool(processes=max(1, workers), initializer=_init_worker,
+                      initargs=(settings, threshold, max_references, __use_stage)) as pool:
+                for i, (task, doc, rows, error) in enumerate(pool.imap_unordered(_analyze, __pending)):
+                    if error is not None:
+                        __failed.append((task, error))
+                    else:
+                        writer.write_table(pa.Table.from_pandas(rows, schema=PARQUET_SCHEMA, preserve_index=False))
+                        __match_count += len(rows)
+                        if store is not None and store.is_versioned(task.md5, task.last_modified):
+                            store.put(scope, task.path, task.md5, task.last_modified, __parameters, doc)
+                            if (i + 1) % __MANIFEST_SAVE_INTERVAL == 0:
+                                store.save()
+                    logging.info(f"[{i + 1}/{len(__pending)}] {task.path}: {error or f'{len(rows)} matches'}")
+    if store is not None:
+        store.save()
+    logging.info(f"Wrote {__match_count} matches of {len(tasks) - len(__failed)} documents to '{output}'")
+    return __failed
+
+
+def main(argv: List[str] = None) -> int:
+    __parser = argparse.ArgumentParser(description="Compares the documents of a Snowflake stage or a local directory "
+                                                   "to the semantha library and writes the matches to Parquet.")
+    __source = __parser.add_mutually_exclusive_group(required=True)
+    __source.add_argument("--stage", nargs="?", const="", metavar="NAME",
+                          help="analyze a Snowflake stage, by default the one of the [snowflake] secrets")
+    __source.add_argument("--directory", help="analyze the documents of a local directory")
+    __parser.add_argument("--output", required=True, help="Parquet file for the matches")
+    __parser.add_argument("--secrets", default=os.path.join(".streamlit", "secrets.toml"),
+                          help="secrets file with the [semantha] and [snowflake] sections")
+    __parser.add_argument("--threshold", type=float, default=0.7, help="similarity threshold")
+    __parser.add_argument("--max-references", type=int, default=1, help="references per matched paragraph")
+    __parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="worker processes")
+    __parser.add_argument("--search", help="only analyze documents whose path contains this text")
+    __parser.add_argument("--limit", type=int, help="maximum number of documents to analyze")
+    __parser.add_argument("--incremental", action="store_true",
+                          help="reuse the stored results of documents that did not change since their last analysis")
+    __args = __parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    __settings = toml.load(__args.secrets)
+    if __args.stage is not None:
+        if __args.stage:
+            __settings["snowflake"] = dict(__settings["snowflake"], stage=__args.stage)
+        __tasks = list(list_stage_tasks(_connect_snowpark(__settings), __args.search, __args.limit))
+        __scope = analysis_scope(__settings["semantha"]["domain"], __settings["snowflake"])
+    else:
+        __tasks = list(list_directory_tasks(__args.directory, __args.search, __args.limit))
+        __scope = analysis_scope(__settings["semantha"]["domain"], {"stage": os.path.abspath(__args.directory)})
+    if len(__tasks) == 0:
+        logging.warning("No analyzable documents found")
+        return 0
+    logging.info(f"Found {len(__tasks)} documents")
+    __failed = run_batch_analysis(__settings, __tasks, __args.output, __args.threshold, __args.max_references,
+                                  __args.workers, state.create_analysis_store(__settings.get("cache", {})) if __args.incremental else None,
+                                  __scope)
+    for task, error in __failed:
+        logging.error(f"Failed: {task.path} ({error})")
+    return 1 if len(__failed) > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,11 +4,7 @@ import hydralit_components as hc
 import streamlit as st
 
 import state
-from pages_views.compare import ComparePage
-from pages_views.document_collection import DocumentCollection
-from pages_views.howto import HowToPage
-from pages_views.rag import RetrievalAugmentedGeneration
-from pages_views.sidebar import CompareSidebarWithSnowflakeSettings, HowToSidebar, CompareSidebarWithTagFilter
+from pages_views.page_registry import PageRegistry
 
 st.set_page_config(
     page_title="K-A-T-E One",
@@ -20,6 +16,8 @@ st.set_page_config(
 st.markdown("<h1 style='text-align: center; background-color: #000045; color: #ece5f6'>K-A-T-E One</h1>", unsafe_allow_html=True)
 st.markdown("<h4 style='text-align: center; background-color: #000045; color: #ece5f6'>Knowledge, Access, and Technology for ESG</h4>", unsafe_allow_html=True)
 
+state.warm_up_answers()
+
 menu_data = [
     {'id': 1, 'label': "How To", 'key': "md_how_to", 'icon': "fa fa-home"},
     {'id': 2, 'label': "Individual Document", 'key': "md_run_analysis"},
@@ -36,21 +34,15 @@ state.set_page_id(int(hc.nav_bar(
 )))
 
 
-__howto_page = HowToPage(state.get_page_id())
-__howto_sidebar = HowToSidebar()
-__compare_page = ComparePage(state.get_page_id())
-__compare_sidebar = CompareSidebarWithSnowflakeSettings()
-__compare_sidebar_with_filter = CompareSidebarWithTagFilter()
-__document_collection = DocumentCollection(state.get_page_id())
-__rag_page = RetrievalAugmentedGeneration(state.get_page_id())
-
-if state.get_page_id() == 1:
-    __howto_page.display_page()
-if state.get_page_id() == 2:
-    __compare_page.display_page()
-    __compare_sidebar_with_filter.display_page()
-if state.get_page_id() == 3:
-    __compare_sidebar.display_page()
-    __document_collection.display_page()
-if state.get_page_id() == 4:
-    __rag_page.display_page()
+# only the views of the active page are imported and built, in the order they are displayed - sidebars come first,
+# so the pages read the threshold and tag filter selected in this run. pandas and numpy are not deferred, streamlit
+# imports both itself
+__pages = PageRegistry()
+__pages.register(1, "pages_views.howto.HowToPage")
+__pages.register(2, "pages_views.sidebar.CompareSidebarWithTagFilter", "pages_views.compare.ComparePage")
+__pages.register(3, "pages_views.sidebar.CompareSidebarWithSnowflakeSettings",
+                 "pages_views.document_collection.DocumentCollection")
+__pages.register(4, "pages_views.rag.RetrievalAugmentedGeneration")
+__pages.display(state.get_page_id())
+if state.get_diagnostics_enabled():
+    __pages.create("pages_views.sidebar.DiagnosticsSidebar").display_page()
@@ -3,11 +3,19 @@ from abc import ABC, abstractmethod
 from typing import Tuple
 
 import streamlit as st
-from PIL import Image
 from semantha_sdk.model.document import Document
 from semantha_sdk.model.paragraph import Paragraph
 from semantha_sdk.model.reference import Reference
 
+__LOGO_PATH = os.path.join(os.path.dirname(__file__), "..", "images", "Semantha-positiv-RGB.png")
+
+
+@st.cache_resource(show_spinner=False)
+def _load_logo() -> bytes:
+    # read once per server process instead of on every rerun
+    with open(__LOGO_PATH, "rb") as f:
+        return f.read()
+
 
 class AbstractPage(ABC):
 
@@ -30,6 +38,12 @@ class AbstractContentPage(AbstractPage, ABC):
         with self._content_placeholder.container():
             self._display_content()
 
+    @staticmethod
+    def _restrict_widget_state(key: str, restrict):
+        # values kept from a previous run may be out of range for the widget now
+        if key in st.session_state:
+            st.session_state[key] = restrict(st.session_state[key])
+
     @staticmethod
     def __display_logo():
         _, _, _, text, logo = st.columns(5)
@@ -37,8 +51,7 @@ class AbstractContentPage(AbstractPage, ABC):
             st.markdown("<h4 style='text-align: right'>brought to you by</h4>", unsafe_allow_html=True)
 
         with logo:
-            image = Image.open(os.path.join(os.path.dirname(__file__), "..", "images", "Semantha-positiv-RGB.png"))
-            st.image(image, width=250)
+            st.image(_load_logo(), width=250)
 
             st.write(
                 """<style>
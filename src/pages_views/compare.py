@@ -1,4 +1,5 @@
 import logging
+import math
 import os
 
 import altair
@@ -6,18 +7,27 @@ import pandas as pd
 import plotly.express as px
 import streamlit as st
 from semantha_sdk.model.document import Document
-from semantha_sdk.model.document_class import DocumentClass
 
 import state
 from pages_views.abstract_pages import AbstractContentPage
-from util.semantha_model_handling import get_paragraph_matches_of_doc
+from util.library_coverage import LibraryCoverage
+from util.semantha_model_handling import filter_match_table_by_similarity, filter_match_table_by_tags, get_match_table, \
+    get_top_matches
 from util.text_handling import short_text
 
 
 class ComparePage(AbstractContentPage):
+    __CACHE_TTL = 3600
+    __CACHE_MAX_ENTRIES = 32
     __MATCH_COLUMN_DEF = [5.9, 1.1, 5.9]
     __LIB_MATCH_COLUMN_DEF = [1.0, 0.2, 5.0]
     __EXAMPLE_FILE = "Hooray_IT_ESG_Report_2021.pdf"
+    __MATCH_PAGE_SIZES = [10, 25, 50]
+    __MATCH_SORT_ORDERS = {
+        "Document order": ("match", True),
+        "Similarity (high to low)": ("similarity", False),
+        "Similarity (low to high)": ("similarity", True)
+    }
 
     def __init__(self, page_id: int):
         super().__init__()
@@ -53,7 +63,7 @@ class ComparePage(AbstractContentPage):
                     __selected_file_name,
                     state.get_semantha().compare_to_library(
                         in_file=__cmp_input_up,
-                        threshold=state.get_similarity_threshold()
+                        threshold=state.CONST_COMPARISON_THRESHOLD
                     )
                 )
                 st.success(
@@ -68,22 +78,37 @@ class ComparePage(AbstractContentPage):
             st.divider()
             st.subheader(f"Results for file '{__doc_tuple[0]}'")
             __selected_tags = state.get_selected_tags_compare_view()
-            self.__display_overall_stats(__doc)
-            self.__display_matches_per_tags_per_page(__doc, __selected_tags)
-            self.__display_library_matches_per_tag(__doc)
-            self.__display_sunburst_chart(__doc, __selected_tags)
-            self.__display_matches(__doc, __selected_tags, __doc.id)
+            # independent library lookups used by the views below are loaded together
+            __semantha_async = state.get_semantha_async()
+            __semantha_async.run(
+                __semantha_async.get_library_index(),
+                __semantha_async.get_category_tree(),
+                __semantha_async.get_library_tags()
+            )
+            # the strictness only filters the matches locally, the views cache their results per strictness
+            __threshold = state.get_similarity_threshold()
+            __match_table = filter_match_table_by_similarity(self.__get_match_table(__doc, __doc.id), __threshold)
+            __view_id = f"{__doc.id}@{__threshold}"
+            self.__display_overall_stats(__match_table)
+            self.__display_matches_per_tags_per_page(__match_table, __selected_tags, __view_id)
+            self.__display_library_matches_per_tag(__match_table, __view_id)
+            self.__display_sunburst_chart(__match_table, __selected_tags, __view_id)
+            self.__display_matches(__match_table, __selected_tags, __view_id)
 
-    def __display_overall_stats(self, doc):
-        __paragraph_matches = get_paragraph_matches_of_doc(doc)
+    @st.cache_data(show_spinner="Collecting matches ...", ttl=__CACHE_TTL,
+                   max_entries=__CACHE_MAX_ENTRIES)
+    def __get_match_table(_self, _doc: Document, doc_id) -> pd.DataFrame:
+        logging.info(f"Building match table for document {doc_id}")
+        return get_match_table(_doc, state.get_semantha().get_tags_of_library_document, state.NO_TAG)
 
+    def __display_overall_stats(self, match_table):
         with st.expander(label="Statistics", expanded=True):
-            st.subheader(f"Total Matches: {len(__paragraph_matches)}")
+            st.subheader(f"Total Matches: {match_table['match'].nunique()}")
 
-    def __display_matches_per_tags_per_page(self, doc, __selected_tags):
+    def __display_matches_per_tags_per_page(self, match_table, __selected_tags, doc_id):
         with st.expander(label="Visualization of Matches by Topics per Page", expanded=True):
             st.subheader(f"Matches by Topics per Page")
-            chart_data = self.__calculate_matches_per_page(doc, __selected_tags, doc.id)
+            chart_data = self.__calculate_matches_per_page(match_table, __selected_tags, doc_id)
             if len(chart_data) == 0:
                 st.error("Nothing to display. Please adjust the filter(s) or start a new analysis.")
             else:
@@ -95,56 +120,67 @@ class ComparePage(AbstractContentPage):
                 )
                 st.altair_chart(chart, use_container_width=True)
 
-    @st.cache_data(show_spinner="Fetching matches ...")
-    def __display_matches(_self, _doc, selected_tags, doc_id):
-
-        logging.info(f"Fetching matches for document {doc_id} with selected tags: {selected_tags}")
+    def __display_matches(self, match_table, selected_tags, doc_id):
+        logging.info(f"Displaying matches for document {doc_id} with selected tags: {selected_tags}")
         with st.expander(label="Text-to-Text Matches", expanded=True):
             st.subheader('Matching Sections')
-            __matches = get_paragraph_matches_of_doc(_doc)
+            __matches = filter_match_table_by_tags(get_top_matches(match_table), selected_tags)
             if len(__matches) == 0:
                 st.error(f"Found no matches for selected topics: {selected_tags}")
-            for idx, match in enumerate(__matches):
-                ref_0 = match[1][0]
-                ref_0_tags = state.get_semantha().get_tags_of_library_document(ref_0.document_id)
-                if ref_0_tags is None:
-                    ref_0_tags = []
-                if len(ref_0_tags) == 0:
-                    ref_0_tags.append(state.NO_TAG)
-                hit = False
-                if len(selected_tags) == 0:
-                    hit = True
-                else:
-                    for ref_0_tag in ref_0_tags:
-                        if ref_0_tag in selected_tags:
-                            hit = True
-                            continue
-                if hit:
-                    with st.container():
-                        st.caption(f"_Match {idx + 1}: {', '.join(ref_0_tags)}_")
-                        col_input_text, col_sim_text, col_reference_text = st.columns(_self.__MATCH_COLUMN_DEF)
-                        if ref_0.similarity > state.CONST_HIGH_SIM:
-                            color = state.CONST_HIGH_SIM_COLOR
-                        elif ref_0.similarity > state.CONST_MID_SIM:
-                            color = state.CONST_MID_SIM_COLOR
-                        else:
-                            color = state.CONST_LOW_SIM_COLOR
-                        text_ref_0 = state.get_semantha().get_text_of_library_paragraph(ref_0.document_id,
-                                                                                        ref_0.paragraph_id)
-                        col_input_text.markdown(f'<p style=text-align:justify>{match[0].text}</p>',
-                                                unsafe_allow_html=True)
-                        col_sim_text.markdown(
-                            f'<p style="background-color:{color};text-align:center">⇄ | {(ref_0.similarity * 100):2.2f} %</p>',
-                            unsafe_allow_html=True)
-                        col_reference_text.markdown(f'<p style=text-align:justify>{text_ref_0}</p>',
-                                                    unsafe_allow_html=True)
-                        st.divider()
+                return
+            __sort_col, __sim_col, __topic_col, __size_col = st.columns([2, 2, 3, 1])
+            __sort_order = __sort_col.selectbox("Sort by", list(self.__MATCH_SORT_ORDERS), key="match_list_sort")
+            __min_similarity = __sim_col.slider("Minimum similarity (%)", min_value=0, max_value=100, value=0,
+                                                key="match_list_min_similarity")
+            __topic_options = sorted(set(__matches["tags"].explode()))
+            self._restrict_widget_state("match_list_topics", lambda topics: [t for t in topics if t in __topic_options])
+            __topics = __topic_col.multiselect("Topics", __topic_options, key="match_list_topics")
+            __page_size = __size_col.selectbox("Per page", self.__MATCH_PAGE_SIZES, key="match_list_page_size")
 
-    def __display_sunburst_chart(self, doc, __selected_tags):
-        __paragraph_matches = get_paragraph_matches_of_doc(doc)
+            __matches = filter_match_table_by_tags(__matches[__matches["similarity"] * 100 >= __min_similarity], __topics)
+            __sort_column, __ascending = self.__MATCH_SORT_ORDERS[__sort_order]
+            __matches = __matches.sort_values(__sort_column, ascending=__ascending, kind="stable")
+            if len(__matches) == 0:
+                st.error("Found no matches for the given filters.")
+                return
+            __page_count = max(1, math.ceil(len(__matches) / __page_size))
+            self._restrict_widget_state("match_list_page", lambda page: min(page, __page_count))
+            __page = st.number_input(f"Page (of {__page_count})", min_value=1, max_value=__page_count, step=1,
+                                     key="match_list_page")
+            __start = (__page - 1) * __page_size
+            __visible = __matches.iloc[__start:__start + __page_size]
+            st.caption(f"Showing matches {__start + 1} - {__start + len(__visible)} of {len(__matches)}")
+            st.divider()
+            # only the reference texts of the visible slice are fetched
+            state.get_semantha().prefetch_library_paragraphs(__visible["document_id"])
+            for match in __visible.itertuples(index=False):
+                self.__display_single_match(match)
+
+    def __display_single_match(self, match):
+        with st.container():
+            st.caption(f"_Match {match.match + 1}: {', '.join(match.tags)}_")
+            col_input_text, col_sim_text, col_reference_text = st.columns(self.__MATCH_COLUMN_DEF)
+            if match.similarity > state.CONST_HIGH_SIM:
+                color = state.CONST_HIGH_SIM_COLOR
+            elif match.similarity > state.CONST_MID_SIM:
+                color = state.CONST_MID_SIM_COLOR
+            else:
+                color = state.CONST_LOW_SIM_COLOR
+            text_ref_0 = state.get_semantha().get_text_of_library_paragraph(match.document_id,
+                                                                            match.ref_paragraph_id)
+            col_input_text.markdown(f'<p style=text-align:justify>{match.text}</p>',
+                                    unsafe_allow_html=True)
+            col_sim_text.markdown(
+                f'<p style="background-color:{color};text-align:center">⇄ | {(match.similarity * 100):2.2f} %</p>',
+                unsafe_allow_html=True)
+            col_reference_text.markdown(f'<p style=text-align:justify>{text_ref_0}</p>',
+                                        unsafe_allow_html=True)
+            st.divider()
+
+    def __display_sunburst_chart(self, match_table, __selected_tags, doc_id):
         with st.expander(label="Visualization of Matches per Topic", expanded=True):
             st.subheader(f"Distribution of Matches per Topic")
-            __labels, __parents = self.__retrieve_categories_for_sunburst_chart(__selected_tags, __paragraph_matches, doc.id)
+            __labels, __parents = self.__retrieve_categories_for_sunburst_chart(__selected_tags, match_table, doc_id)
             data = dict(
                 character=[short_text(label) for label in __labels],
                 parent=[short_text(parent) for parent in __parents],
@@ -153,9 +189,10 @@ class ComparePage(AbstractContentPage):
             fig = px.sunburst(data, names='character', parents='parent', hover_name='hover', hover_data={"character": False, "parent": False, "hover": False}, height=1200, width=8000)
             st.plotly_chart(fig, use_container_width=True)
 
-    def __display_library_matches_per_tag(self, doc):
+    def __display_library_matches_per_tag(self, match_table, doc_id):
         __available_tags = state.get_semantha().get_library_tags()
-        __tag_match_dict = self.__retrieve_library_matches_per_tag(__available_tags, doc, doc.id)
+        # built once per document and strictness, selecting another topic only reads from it
+        __coverage = self.__get_library_coverage(__available_tags, match_table, doc_id)
         __selected_tag = __available_tags[0]
         with st.expander(label="Library Matches per Topic", expanded=True):
             col_h1, _, col_h2 = st.columns(self.__LIB_MATCH_COLUMN_DEF)
@@ -165,7 +202,7 @@ class ComparePage(AbstractContentPage):
             with col_tags.container():
                 for __tag in __available_tags:
                     col_marker, col_button = st.columns([1, 15])
-                    if len(__tag_match_dict[__tag]["matched"]) > 0:
+                    if __coverage.is_matched(__tag):
                         col_marker.markdown('✔')
                     else:
                         col_marker.markdown('✖️')
@@ -175,114 +212,62 @@ class ComparePage(AbstractContentPage):
             with col_h2.container():
                 st.subheader(f"For topic '{__selected_tag}' matches were found for the following library items")
             with col_matches.container():
-                __matched = __tag_match_dict[__selected_tag]["matched"]
-                __not_matched = __tag_match_dict[__selected_tag]["not_matched"]
+                __matched = __coverage.get_matched(__selected_tag)
+                __not_matched = __coverage.get_not_matched(__selected_tag)
                 for m in __matched:
                     st.success(f"__{m.name.strip()}__: '{m.content_preview}'")
                 st.subheader(f"For topic '{__selected_tag}' _no_ matches were found for the following library items")
                 for nm in __not_matched:
                     st.error(f"__{nm.name.strip()}__: '{nm.content_preview}'")
 
-    @st.cache_data(show_spinner="Retrieving library matches per topic...")
-    def __retrieve_library_matches_per_tag(_self, tags, _doc, doc_id):
-        logging.info(f"Retrieving library matches per tag for tags {tags} and document with id {doc_id}")
-        result_dict = {}
-        for t in tags:
-            __matched = []
-            __not_matched = []
-            __doc_ids_of_paragraph_matches = [i.document_id for x in get_paragraph_matches_of_doc(_doc) for i in x[1]]
-            __lib_entries_for_tag = state.get_semantha().get_library_entries_for_tag(t)
-            for entry in __lib_entries_for_tag:
-                if entry.id in __doc_ids_of_paragraph_matches:
-                    __matched.append(entry)
-                else:
-                    __not_matched.append(entry)
-            result_dict[t] = {
-                "matched": __matched,
-                "not_matched": __not_matched
-            }
-        return result_dict
+    @st.cache_data(show_spinner="Retrieving library matches per topic...", ttl=__CACHE_TTL,
+                   max_entries=__CACHE_MAX_ENTRIES)
+    def __get_library_coverage(_self, tags, _match_table, doc_id) -> LibraryCoverage:
+        logging.info(f"Building library coverage for tags {tags} and document with id {doc_id}")
+        return LibraryCoverage(state.get_semantha().get_library_index(), tags,
+                               {doc_id: _match_table["document_id"].unique()})
 
     @staticmethod
     def __open_example_file(file_name: str):
         return open(os.path.join(os.path.dirname(__file__), "..", "..", "data", "single", file_name), "rb")
 
-    @st.cache_data(show_spinner="Fetching matches per page...")
-    def __calculate_matches_per_page(_self, _doc: Document, selected_tags, doc_id):
+    @st.cache_data(show_spinner="Fetching matches per page...", ttl=__CACHE_TTL,
+                   max_entries=__CACHE_MAX_ENTRIES)
+    def __calculate_matches_per_page(_self, _match_table, selected_tags, doc_id):
 
         logging.info(f"Fetching matches for document {doc_id} with selected tags: {selected_tags}")
 
-        __matches_dict = {}
-        __ref_tag_cache = {}
-        for idx, p in enumerate(_doc.pages):
-            if str(idx) not in __matches_dict:
-                __matches_dict[str(idx)] = {}
-            if p.contents is not None:
-                for c in p.contents:
-                    if c.paragraphs is not None:
-                        for par in c.paragraphs:
-                            if par.references is not None:
-                                for ref in par.references:
-                                    if ref.document_id in __ref_tag_cache:
-                                        tags = __ref_tag_cache[ref.document_id]
-                                    else:
-                                        tags = state.get_semantha().get_tags_of_library_document(ref.document_id)
-                                        __ref_tag_cache[ref.document_id] = tags
-                                    if len(tags) == 0:
-                                        if state.NO_TAG in __matches_dict[str(idx)]:
-                                            __matches_dict[str(idx)][state.NO_TAG] += 1
-                                        else:
-                                            __matches_dict[str(idx)][state.NO_TAG] = 1
-                                    for tag in tags:
-                                        if tag in __matches_dict[str(idx)]:
-                                            __matches_dict[str(idx)][tag] += 1
-                                        else:
-                                            __matches_dict[str(idx)][tag] = 1
-        __matches_rec = []
-        for page, tags in __matches_dict.items():
-            for tag, count in tags.items():
-                if tag in selected_tags or len(selected_tags) == 0:
-                    __matches_rec.append([str(int(page) + 1), tag, int(count)])
-        __match_df = pd.DataFrame.from_records(
-            __matches_rec,
-            columns=["Page", "Topic", "References"]
-        )
+        __tags_per_ref = _match_table[["page", "tags"]].explode("tags")
+        if len(selected_tags) > 0:
+            __tags_per_ref = __tags_per_ref[__tags_per_ref["tags"].isin(list(selected_tags))]
+        __counts = __tags_per_ref.groupby(["page", "tags"], sort=False).size()
+        __match_df = pd.DataFrame({
+            "Page": (__counts.index.get_level_values("page") + 1).astype(str),
+            "Topic": __counts.index.get_level_values("tags"),
+            "References": __counts.values.astype(int)
+        })
         return __match_df
 
-    @st.cache_data(show_spinner="Fetching topics for sunburst chart...")
-    def __retrieve_categories_for_sunburst_chart(_self, selected_tags, __paragraph_matches, doc_id):
+    @st.cache_data(show_spinner="Fetching topics for sunburst chart...", ttl=__CACHE_TTL,
+                   max_entries=__CACHE_MAX_ENTRIES)
+    def __retrieve_categories_for_sunburst_chart(_self, selected_tags, _match_table, doc_id):
         logging.info(f"Fetching categories for sunburst chart for document {doc_id}")
         __characters = []
         __parents = []
+        __seen_categories = set()
 
-        for idx, m in enumerate(__paragraph_matches):
-            __ref_0 = m[1][0]
-            __matches_tags = state.get_semantha().get_tags_of_library_document(__ref_0.document_id)
-            for t in __matches_tags:
-                if t in selected_tags or len(selected_tags) == 0:
-                    __category = state.get_semantha().get_category_of_document(__ref_0.document_id)
-                    if __category is None:
-                        if "uncategorized" not in __characters:
-                            __characters.append("uncategorized")
-                            __parents.append("")
-                        __parents.append("uncategorized")
-                    else:
-                        _self.__add_category(__category, __characters, __parents)
-                        __parents.append(__category.name)
-                    __characters.append(f"Match {idx + 1}: {short_text(m[0].text, 100)}")
-                    continue
+        __matches = filter_match_table_by_tags(get_top_matches(_match_table), selected_tags)
+        for match in __matches.itertuples(index=False):
+            __category = state.get_semantha().get_category_of_document(match.document_id)
+            if __category is None:
+                __path = ["uncategorized"]
+            else:
+                __path = state.get_semantha().get_category_path(__category.id)
+            for level, __c_name in enumerate(__path):
+                if __c_name not in __seen_categories:
+                    __seen_categories.add(__c_name)
+                    __characters.append(__c_name)
+                    __parents.append(__path[level - 1] if level > 0 else "")
+            __characters.append(f"Match {match.match + 1}: {short_text(match.text, 100)}")
+            __parents.append(__path[-1])
         return __characters, __parents
-
-    def __add_category(self, category: DocumentClass, characters, parents):
-        __category = state.get_semantha().get_category_by_id(category.id)
-        __c_name = __category.name
-        if __category.parent_id is None:
-            if __c_name not in characters:
-                characters.append(__c_name)
-                parents.append("")
-            return
-        else:
-            self.__add_category(state.get_semantha().get_category_by_id(__category.parent_id), characters, parents)
-            if __c_name not in characters:
-                characters.append(__c_name)
-                parents.append(state.get_semantha().get_category_by_id(__category.parent_id).name)
@@ -1,5 +1,9 @@
 import base64
 import logging
+import math
+import pickle
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List
 
 import numpy as np
 import pandas as pd
@@ -7,11 +11,21 @@ import streamlit as st
 
 import state
 from pages_views.abstract_pages import AbstractContentPage
-from util.semantha_model_handling import get_paragraph_matches_of_doc
-from util.text_handling import short_text
+from util.analysis_store import analysis_parameters
+from util.file_types import ANALYZABLE_EXTENSIONS, is_analyzable
+from util.library_coverage import COLLECTION_COLUMN, LibraryCoverage
+from util.pdf_preview import can_render_pdf_pages, render_pdf_pages
+from util.semantha_model_handling import CompactDocument, get_paragraph_matches_of_doc
+from util.text_handling import human_readable_size, short_text
 
 
 class DocumentCollection(AbstractContentPage):
+    __PAGE_SIZES = [10, 20, 50]
+    __PREVIEW_PAGES = 2
+    __PREVIEW_SCALE = 1.0
+    __PREVIEW_BYTE_BUDGET = 2 * 1024 * 1024
+    __CACHE_TTL = 3600
+    __CACHE_MAX_ENTRIES = 8
 
     def __init__(self, page_id: int):
         super().__init__()
@@ -19,63 +33,80 @@ class DocumentCollection(AbstractContentPage):
             self._content_placeholder = st.container()
         else:
             self._content_placeholder = st.empty()
-        self.__tags = state.get_semantha().get_library_tags()
 
-    def _display_content(self, max_fetch: int = 100, max_files: int = 20):
+    @property
+    def __tags(self) -> List[str]:
+        # only fetched when the page is displayed, the connector caches the library tags
+        return state.get_semantha().get_library_tags()
+
+    def _display_content(self):
         sf_settings = state.get_snowflake_cred_dict()
         for v in sf_settings.values():
             if not v:
                 st.error("At least one field of the streamlit account information is empty. "
                          "Please fill in all account information before you proceed.")
                 return
-        # limit fetching of list of documents from snowflake to the first 100 documents
-        __file_list = state.get_snowpark().get_list_of_file_names(max_fetch)
-        if __file_list is not None:
-            __files_to_display = []
-            for f in __file_list:
-                doc = FileDocument(f)
-                # limit downloading of documents from snowflake to the first 20 documents
-                if len(__files_to_display) == max_files:
-                    break
-                if doc.is_analyzable():
-                    __files_to_display.append(doc)
-                else:
-                    logging.debug(f"Found non analyzable file '{doc.path}'")
-            self._display_files(__files_to_display)
+        self._display_files()
         self.__display_analysis_overview()
+        self.__display_library_coverage()
         __tag_for_summarization = state.get_tag_for_summarization()
         if __tag_for_summarization is not None:
             self.__display_summarization(__tag_for_summarization)
         self.__display_analysis_result()
 
-    def _display_files(self, documents):
-        __selected_file = None
-        for d in documents:
-            if d.is_viewable():
-                __selected_file = d
-                break
+    def _display_files(self):
         with st.expander(label="Document Collection", expanded=True):
             st.write("Below you can find your documents from your Snowflake data collection. "
                      "A document preview can be activated by clicking on the arrow icon on the left side. "
-                     "Please note that only the first 20 documents are displayed in this demo.")
+                     "Use the search field and the page selection to browse through the collection.")
+            documents = self.__display_file_browser_controls()
+            if len(documents) == 0:
+                st.error("No analyzable documents found in the Snowflake stage.")
+                return
+            __selected_file = None
+            for d in documents:
+                if d.is_viewable():
+                    __selected_file = d
+                    break
             __list_col, __pv_col = st.columns(2)
             __doc_container = __list_col.container()
             for i, doc in enumerate(documents):
                 __but_col, __doc_col = __doc_container.columns([0.8, 10])
                 __curr_file_name = doc.get_name()
                 with __doc_col.container():
-                    st.info(__curr_file_name)
+                    st.info(f"{__curr_file_name} ({human_readable_size(doc.size)})"
+                            if doc.size is not None else __curr_file_name)
                 __viewable = doc.is_viewable()
-                __view_button = __but_col.button('↗️', disabled=not __viewable, key=f'open_doc_{i}',
+                __view_button = __but_col.button('↗️', disabled=not __viewable, key=f'open_doc_{doc.path}',
                                                  help="Switch file preview")
                 if __view_button:
                     __selected_file = doc
             with __pv_col.container():
                 self.__display_pdf(__selected_file)
         _, _, __bc, _, _ = st.columns(5)
-        __analyze_button = __bc.button('Analyze Document Collection', disabled=False, key='analyze_button')
+        __analyze_button = __bc.button('Analyze Document Collection', disabled=False, key='analyze_button',
+                                       help="Analyzes the documents of the current page")
         if __analyze_button:
-            self.__analyze_doc_collection(documents)
+            self.__analyze_doc_collection(documents, state.get_analysis_workers())
+
+    def __display_file_browser_controls(self):
+        __search_col, __size_col, __page_col = st.columns([4, 1, 1])
+        __search = __search_col.text_input("Search", key="collection_search",
+                                           placeholder="Filter by file name...").strip()
+        __page_size = __size_col.selectbox("Per page", self.__PAGE_SIZES, index=1, key="collection_page_size")
+        __file_count = state.get_snowpark().count_files(ANALYZABLE_EXTENSIONS, __search)
+        __page_count = max(1, math.ceil(__file_count / __page_size))
+        self._restrict_widget_state("collection_page", lambda page: min(page, __page_count))
+        __page = __page_col.number_input(f"Page (of {__page_count})", min_value=1, max_value=__page_count, step=1,
+                                         key="collection_page")
+        __files = state.get_snowpark().list_files(
+            ANALYZABLE_EXTENSIONS, __search, limit=__page_size, offset=(__page - 1) * __page_size
+        )
+        st.caption(f"{__file_count} analyzable documents found")
+        return [
+            FileDocument(f.RELATIVE_PATH, size=f.SIZE, last_modified=f.LAST_MODIFIED, md5=f.MD5)
+            for f in __files.itertuples(index=False)
+        ]
 
     def __display_analysis_overview(self):
         __docs_with_refs_with_tags = state.get_docs_with_refs_with_tags()
@@ -172,7 +203,7 @@ class DocumentCollection(AbstractContentPage):
                                             __selected_tag = __tag
             state.set_tag_for_summarization(__selected_tag)
 
-    @st.cache_data(show_spinner=False)
+    @st.cache_data(show_spinner=False, ttl=__CACHE_TTL, max_entries=__CACHE_MAX_ENTRIES)
     def __determine_all_matched_tag(_self, docs_with_refs_with_tags):
         matched_tags = {}
         for _, refs in docs_with_refs_with_tags.items():
@@ -185,65 +216,175 @@ class DocumentCollection(AbstractContentPage):
                         matched_tags[__tag] = 1
         return matched_tags
 
-    def __analyze_doc_collection(self, documents):
+    def __display_library_coverage(self):
+        __docs = state.get_documents_with_references()
+        if len(__docs) == 0:
+            return
+        with st.expander(label="Library Coverage", expanded=False):
+            st.write("Share (%) of the library entries of every topic that were matched by each document and by the "
+                     "collection as a whole.")
+            __coverage = self.__get_library_coverage(tuple(self.__tags), __docs,
+                                                     tuple((d.name, d.id, len(d)) for d in __docs))
+            # documents are keyed by their position, several of them may have the same name
+            __labels = dict(zip(__coverage.documents, self.__get_document_labels(__docs)))
+            st.dataframe((100 * __coverage.get_coverage()).round(1).rename(columns=__labels), use_container_width=True)
+            __tag = st.selectbox("Topic", __coverage.tags, key="coverage_topic")
+            if __tag is not None:
+                __not_matched = __coverage.get_not_matched(__tag)
+                st.write(f"For topic '{__tag}' {len(__coverage.get_matched(__tag))} library items were matched, "
+                         f"_no_ document matched the following {len(__not_matched)} library items:")
+                for nm in __not_matched:
+                    st.error(f"__{nm.name.strip()}__: '{nm.content_preview}'")
+
+    @st.cache_data(show_spinner="Computing library coverage...", ttl=__CACHE_TTL, max_entries=__CACHE_MAX_ENTRIES)
+    def __get_library_coverage(_self, tags, _docs, doc_keys) -> LibraryCoverage:
+        logging.info(f"Building library coverage of {len(doc_keys)} documents")
+        __matched_ids = {
+            str(i): {r.document_id for _, refs in get_paragraph_matches_of_doc(doc) for r in refs}
+            for i, doc in enumerate(_docs)
+        }
+        return LibraryCoverage(state.get_semantha().get_library_index(), list(tags), __matched_ids)
+
+    @staticmethod
+    def __get_document_labels(docs) -> List[str]:
+        # names of the documents, numbered from the second one on where they are not unique
+        __taken = {COLLECTION_COLUMN}
+        __labels = []
+        for doc in docs:
+            __label = doc.name
+            __number = 1
+            while __label in __taken:
+                __number += 1
+                __label = f"{doc.name} ({__number})"
+            __taken.add(__label)
+            __labels.append(__label)
+        return __labels
+
+    def __analyze_doc_collection(self, documents, max_workers: int):
         state.reset_documents_with_references()
         state.reset_docs_with_refs_with_tags()
         progress_text = "Comparing document collection with references. This will take some time!"
         my_bar = st.progress(0.0, text=progress_text)
         increment = 1 / len(documents)
-        for i, doc in enumerate(documents):
-            __curr_file_name = doc.get_name()
-            my_bar.progress((i + 1) * increment, text=f"{progress_text} Processing file '{__curr_file_name}'")
-            state.add_document_with_references(state.get_semantha().compare_to_library(in_file=doc.as_stream(),
-                                                                                       threshold=state.get_similarity_threshold()))
-        with st.spinner("Analyzing topics."):
-            __docs_with_tags = {}
-            for doc in state.get_documents_with_references():
-                __matches = get_paragraph_matches_of_doc(doc)
-                __matches_with_tags = []
-                for m in __matches:
-                    __matches_with_tags.append({
-                        m[0].id: {
-                            'ref': m[1][0],
-                            'tag': state.get_semantha().get_tags_of_library_document(m[1][0].document_id)[0]
-                        }
-                    })
-                __docs_with_tags[doc.name] = __matches_with_tags
-            state.set_docs_with_refs_with_tags(__docs_with_tags)
+        __docs_with_tags = {}
+        # connectors and settings are resolved in the script thread, the workers only talk to the backends
+        __semantha = state.get_semantha()
+        __snowpark = state.get_snowpark()
+        __threshold = state.get_similarity_threshold()
+        __store = state.get_analysis_store()
+        __scope = state.get_analysis_scope()
+        __parameters = analysis_parameters(__threshold, 1, __semantha.split_pages, __semantha.get_library_fingerprint())
+        # results of files that did not change since their last analysis are reused
+        __stored = {doc.path: __store.get(__scope, doc.path, doc.md5, doc.last_modified, __parameters)
+                    for doc in documents}
+        # results by position in the collection, added in that order whatever order the comparisons finish in
+        __results = {i: __stored[doc.path] for i, doc in enumerate(documents) if __stored[doc.path] is not None}
+        __failed = {}
+        __added = 0
+        __live_results = st.empty()
+        if len(__results) > 0:
+            st.info(f"Reusing the results of {len(__results)} unchanged documents, "
+                    f"analyzing {len(documents) - len(__results)} new or changed documents.")
+            __added = self.__add_results_in_order(__results, __failed, __added, __docs_with_tags)
+            my_bar.progress(len(__results) * increment, text=progress_text)
+            self.__display_live_results(__live_results, __docs_with_tags)
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            __futures = {
+                executor.submit(self.__compare_document, __semantha, __snowpark, __store, __scope, doc,
+                                __threshold, __parameters): i
+                for i, doc in enumerate(documents) if i not in __results
+            }
+            for future in as_completed(__futures):
+                __idx = __futures[future]
+                try:
+                    __results[__idx] = future.result()
+                except Exception as e:
+                    logging.exception(f"Comparing file '{documents[__idx].get_name()}' to references failed")
+                    __failed[__idx] = f"{type(e).__name__}: {e}"
+                __done = len(__results) + len(__failed)
+                my_bar.progress(__done * increment, text=f"{progress_text} {__done} of {len(documents)} files done")
+                __before = __added
+                __added = self.__add_results_in_order(__results, __failed, __added, __docs_with_tags)
+                if __added > __before:
+                    self.__display_live_results(__live_results, __docs_with_tags)
+        __store.save()
+        __live_results.empty()
+        if len(__failed) > 0:
+            st.error(f"{len(__failed)} of {len(documents)} documents could not be compared to the references, the "
+                     f"results of the others are shown below:\n" +
+                     "\n".join(f"- {documents[i].get_name()}: {__failed[i]}" for i in sorted(__failed)))
+        else:
             st.success("Analysis of document collection is done. Results are shown below.")
 
+    def __add_results_in_order(self, results: dict, failed: dict, added: int, docs_with_tags: dict) -> int:
+        # adds the results following the 'added' documents up to the first one still being compared
+        while added in results or added in failed:
+            if added in results:
+                self.__add_result(results[added], docs_with_tags)
+            added += 1
+        return added
+
+    def __add_result(self, doc_with_refs: CompactDocument, docs_with_tags: dict):
+        state.add_document_with_references(doc_with_refs)
+        docs_with_tags[doc_with_refs.name] = self.__get_matches_with_tags(doc_with_refs)
+        state.set_docs_with_refs_with_tags(docs_with_tags)
+
+    def __display_live_results(self, live_results, docs_with_tags: dict):
+        with live_results.container():
+            with st.expander(label="Analysis Result", expanded=True):
+                self.__display_intermediate_results(docs_with_tags)
+
+    @staticmethod
+    def __compare_document(semantha, snowpark, store, scope: str, doc, threshold: float,
+                           parameters: str) -> CompactDocument:
+        __result = CompactDocument.from_document(semantha.compare_to_library(
+            in_file=snowpark.get_document(doc.path, doc.md5, doc.last_modified),
+            threshold=threshold
+        ))
+        if store.is_versioned(doc.md5, doc.last_modified):
+            store.put(scope, doc.path, doc.md5, doc.last_modified, parameters, __result)
+        return __result
+
+    @staticmethod
+    def __get_matches_with_tags(doc):
+        __matches_with_tags = []
+        for m in get_paragraph_matches_of_doc(doc):
+            __matches_with_tags.append({
+                m[0].id: {
+                    'ref': m[1][0],
+                    'tag': next(iter(state.get_semantha().get_tags_of_library_document(m[1][0].document_id)),
+                                state.NO_TAG)
+                }
+            })
+        return __matches_with_tags
+
+    @staticmethod
+    def __display_intermediate_results(docs_with_refs_with_tags):
+        for name, refs in docs_with_refs_with_tags.items():
+            __tag_list = sorted({v["tag"] for r in refs for v in r.values()})
+            __doc_col, __tag_col = st.columns([1, 2])
+            __doc_col.info(name)
+            if len(__tag_list) > 0:
+                __tag_col.write(", ".join(__tag_list))
+            else:
+                __tag_col.write("_No matches found._")
+
     def __display_summarization(self, tag):
-        __seen_par_ids = []
         with st.expander(label=f"Summarization for Topic '{tag}'", expanded=True):
             with st.spinner("Generating the summary..."):
-                __sources = []
-                __docs_with_refs = state.get_documents_with_references()
-                __docs_with_refs_with_tags = state.get_docs_with_refs_with_tags()
+                __docs_by_name = {d.name: d for d in state.get_documents_with_references()}
                 __relevant_sections = []
                 for doc_name, refs in state.get_docs_with_refs_with_tags().items():
+                    if doc_name not in __docs_by_name:
+                        continue
+                    __paragraph_index = state.get_paragraph_index(__docs_by_name[doc_name])
                     for r in refs:
                         for ref_id, v in r.items():
                             if v["tag"] == tag:
-                                for input_doc in __docs_with_refs:
-                                    if input_doc.name == doc_name:
-                                        __visited_paragraphs = []
-                                        __delayed_break = False
-                                        for page in input_doc.pages:
-                                            if page.contents is not None:
-                                                for content in page.contents:
-                                                    if content.paragraphs is not None:
-                                                        for p in content.paragraphs:
-                                                            __visited_paragraphs.append(p)
-                                                            if __delayed_break:
-                                                                break
-                                                            if p.id == ref_id:
-                                                                __delayed_break = True
-                                                    if __delayed_break:
-                                                        break
-                                            if __delayed_break:
-                                                break
-                                        __relevant_sections.append(
-                                            ("\n".join(p.text for p in __visited_paragraphs[-3:]), doc_name))
+                                __relevant_sections.append((
+                                    "\n".join(p.text for p in __paragraph_index.get_context_window(ref_id)),
+                                    doc_name
+                                ))
                 __sources = [p for p, _ in __relevant_sections]
                 __summarization = state.get_semantha().summarize(__sources, tag)
                 if __summarization is not None:
@@ -254,30 +395,59 @@ class DocumentCollection(AbstractContentPage):
                 else:
                     st.error("Unfortunately no summary could be generate for the given documents!")
 
-    @staticmethod
-    def __display_pdf(document):
+    def __display_pdf(self, document):
         if document is None:
             st.error("None of the provided documents can be displayed. Currently, only PDF document display is supported.")
-        pdf_display = F'<center><iframe src="data:application/pdf;base64,{document.as_base64()}" width="600" height="800" type="application/pdf"></iframe></center>'
-        st.markdown(pdf_display, unsafe_allow_html=True)
+            return
+        if can_render_pdf_pages():
+            __remaining_bytes = self.__PREVIEW_BYTE_BUDGET
+            for idx, page in enumerate(document.as_preview_pages(self.__PREVIEW_PAGES, self.__PREVIEW_SCALE)):
+                if len(page) > __remaining_bytes:
+                    st.caption(f"Preview limited to the first {idx} page(s).")
+                    break
+                st.image(page, caption=f"Page {idx + 1}", use_column_width=True)
+                __remaining_bytes -= len(page)
+        elif document.size is not None and document.size * 4 / 3 <= self.__PREVIEW_BYTE_BUDGET:
+            # without a PDF renderer only small documents are embedded, base64 adds a third to the size
+            pdf_display = F'<center><iframe src="data:application/pdf;base64,{document.as_base64()}" width="600" height="800" type="application/pdf"></iframe></center>'
+            st.markdown(pdf_display, unsafe_allow_html=True)
+        else:
+            st.info(f"'{document.get_name()}' is too large for a preview.")
 
 
 class FileDocument:
-    def __init__(self, path: str):
+
+    def __init__(self, path: str, size: int = None, last_modified=None, md5: str = None):
         self.path = path
+        self.size = size
+        self.last_modified = last_modified
+        self.md5 = md5
 
     def get_name(self):
         return self.path.split("/")[-1]
 
     def is_viewable(self):
-        return self.path.endswith(".pdf")
+        return self.path.lower().endswith(".pdf")
 
     def is_analyzable(self):
-        return self.path.endswith(".pdf") or self.path.endswith(".txt") or self.path.endswith(".docx")
+        return is_analyzable(self.path)
 
     def as_base64(self):
         with self.as_stream() as f:
             return base64.b64encode(f.read()).decode('utf-8')
 
     def as_stream(self):
-        return state.get_snowpark().get_document(self.path)
+        return state.get_snowpark().get_document(self.path, self.md5, self.last_modified)
+
+    def as_preview_pages(self, page_count: int, scale: float) -> List[bytes]:
+        if self.md5 is None and self.last_modified is None:
+            with self.as_stream() as f:
+                return render_pdf_pages(f.read(), 0, page_count, scale)
+        __key = f"{self.path}|{self.md5}|{self.last_modified}|{page_count}|{scale}"
+        __cached = state.get_preview_cache().get_bytes(__key)
+        if __cached is not None:
+            return pickle.loads(__cached)
+        with self.as_stream() as f:
+            __pages = render_pdf_pages(f.read(), 0, page_count, scale)
+        state.get_preview_cache().put_bytes(__key, pickle.dumps(__pages))
+        return __pages
@@ -0,0 +1,28 @@
+import importlib
+import inspect
+from typing import Dict, List
+
+from pages_views.abstract_pages import AbstractPage
+
+
+# views per page id given by their qualified class name - a view's module is only imported when its page is shown
+class PageRegistry:
+
+    def __init__(self):
+        self.__views: Dict[int, List[str]] = {}
+
+    def register(self, page_id: int, *views: str):
+        self.__views[page_id] = list(views)
+
+    def create(self, view: str, page_id: int = None) -> AbstractPage:
+        __module, __class_name = view.rsplit(".", 1)
+        __class = getattr(importlib.import_module(__module), __class_name)
+        # content pages take the active page id, sidebars take no arguments
+        if page_id is not None and "page_id" in inspect.signature(__class.__init__).parameters:
+            return __class(page_id)
+        return __class()
+
+    def display(self, page_id: int):
+        # all views of a page are built before the first one is displayed, like their placeholders were before
+        for view in [self.create(v, page_id) for v in self.__views.get(page_id, [])]:
+            view.display_page()
@@ -1,4 +1,8 @@
-from typing import List
+import csv
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from io import BytesIO, StringIO
+from typing import Dict, List, Optional
 
 import pandas as pd
 import streamlit as st
@@ -10,6 +14,9 @@ from pages_views.abstract_pages import AbstractContentPage
 
 class RetrievalAugmentedGeneration(AbstractContentPage):
     __stop_tokens = ["References:", "Reference:", "Referenzen:", "Referenz:"]
+    __QUESTIONNAIRE_COLUMNS = ["Question", "Answer", "References", "Topics", "Error"]
+    __QUESTIONNAIRE_WORKERS = 8
+    __QUESTIONNAIRE_MAX_QUESTIONS = 1000
 
     def __init__(self, page_id: int):
         super().__init__()
@@ -20,9 +27,8 @@ class RetrievalAugmentedGeneration(AbstractContentPage):
 
     def _display_content(self):
         st.write("Enter your question about ESG and ESG regulations.")
-        st.markdown("__A few example questions that can be used for testing:__\n"
-                    "* What do we have to be careful of concerning personal data?\n"
-                    "* How should ESG solutions adapt to changing demands of stakeholders and regulators?")
+        st.markdown("__A few example questions that can be used for testing:__\n" +
+                    "\n".join(f"* {q}" for q in state.RAG_EXAMPLE_QUESTIONS))
         __dummy = ""
         __question = st.text_input(
             key="rag_question",
@@ -39,23 +45,34 @@ class RetrievalAugmentedGeneration(AbstractContentPage):
             else:
                 __dummy = __question
                 with st.spinner("Generating an answer to your question..."):
-                    __answer = state.get_semantha().generate_retrieval_augmented_answer(__question)
+                    # the library index for the reference topics is loaded while the answer is generated
+                    __semantha_async = state.get_semantha_async()
+                    __answer, _ = __semantha_async.run(
+                        __semantha_async.generate_retrieval_augmented_answer(__question),
+                        __semantha_async.get_library_index()
+                    )
                     self.__display_answer_text(__answer.answer)
                     self.__display_references(__answer.references)
+        self.__display_questionnaire()
 
     def __display_answer_text(self, answer: str):
         with st.expander("Answer", expanded=True):
-            for swt in self.__stop_tokens:
-                answer = answer.split(swt, 1)[0]
-            st.markdown(answer)
+            st.markdown(self.__strip_references(answer))
+
+    def __strip_references(self, answer: str) -> str:
+        for swt in self.__stop_tokens:
+            answer = answer.split(swt, 1)[0]
+        return answer
 
     def __display_references(self, references: List[AnswerReference]):
+        # one tag lookup per referenced library document
+        __semantha = state.get_semantha()
+        __topics = {r.id: next(iter(__semantha.get_tags_of_library_document(r.id)), "") for r in references}
         ref_df = pd.DataFrame.from_records(
             [
                 [
                     r.name,
-                    state.get_semantha().get_tags_of_library_document(r.id)[
-                        0] if state.get_semantha().get_tags_of_library_document(r.id) is not None else "",
+                    __topics[r.id],
                     r.content
                 ]
                 for r in references
@@ -69,3 +86,134 @@ class RetrievalAugmentedGeneration(AbstractContentPage):
         ref_df.index = ref_df.index + 1
         with st.expander("References", expanded=True):
             st.dataframe(ref_df, use_container_width=True)
+
+    def __display_questionnaire(self):
+        with st.expander("Questionnaire", expanded=state.get_questionnaire_results() is not None):
+            st.write("Answer a whole set of questions at once: upload a CSV or Excel file with one question per row, "
+                     "in a column named 'question' or, without such a header, as the whole line of a CSV file or the "
+                     "first column of an Excel file.")
+            __file = st.file_uploader("questionnaire", type=["csv", "xlsx"], key="rag_questionnaire",
+                                      label_visibility="collapsed")
+            __run_button = st.button("Answer all questions", disabled=__file is None, key="rag_questionnaire_run")
+            __table = st.empty()
+            if __run_button:
+                __questions = self.__read_questions(__file)
+                if __questions is not None:
+                    state.set_questionnaire_results(self.__answer_questions(__questions, __table))
+            __results = state.get_questionnaire_results()
+            if __results is not None:
+                __table.dataframe(__results, use_container_width=True)
+                __csv_col, __parquet_col, _ = st.columns([1, 1, 3])
+                __csv_col.download_button("Export as CSV", __results.to_csv(index=False).encode("utf-8"),
+                                          file_name="answers.csv", mime="text/csv", key="rag_questionnaire_csv")
+                __parquet = BytesIO()
+                __results.to_parquet(__parquet, index=False)
+                __parquet_col.download_button("Export as Parquet", __parquet.getvalue(), file_name="answers.parquet",
+                                              mime="application/octet-stream", key="rag_questionnaire_parquet")
+
+    def __read_questions(self, file) -> Optional[List[str]]:
+        try:
+            if file.name.lower().endswith(".xlsx"):
+                __questions = self.__get_excel_questions(pd.read_excel(file, header=None, dtype=str))
+            else:
+                __questions = self.__get_csv_questions(self.__decode(file.getvalue()))
+        except ImportError:
+            st.error("Reading Excel files requires the 'openpyxl' package, please upload a CSV file instead.")
+            return None
+        except (ValueError, csv.Error) as e:
+            st.error(f"Could not read the questions from '{file.name}': {e}")
+            return None
+        __questions = [q.strip() for q in __questions if isinstance(q, str) and q.strip()]
+        if len(__questions) == 0:
+            st.error(f"No questions found in '{file.name}'.")
+            return None
+        if len(__questions) > self.__QUESTIONNAIRE_MAX_QUESTIONS:
+            st.warning(f"Only the first {self.__QUESTIONNAIRE_MAX_QUESTIONS} of {len(__questions)} questions are "
+                       f"answered.")
+            __questions = __questions[:self.__QUESTIONNAIRE_MAX_QUESTIONS]
+        return __questions
+
+    @staticmethod
+    def __get_excel_questions(rows: pd.DataFrame) -> List[str]:
+        # a header row is only expected if it names the question column
+        __header = [str(v).strip().lower() for v in rows.iloc[0]] if len(rows) > 0 else []
+        if "question" in __header:
+            return list(rows.iloc[1:, __header.index("question")])
+        __columns = rows.dropna(axis=1, how="all")
+        if len(__columns.columns) == 0:
+            return []
+        if len(__columns.columns) > 1:
+            st.warning(f"Only the first column is read, the other {len(__columns.columns) - 1} columns are ignored. "
+                       f"Name the column with the questions 'question' to read another one.")
+        return list(__columns.iloc[:, 0])
+
+    @staticmethod
+    def __get_csv_questions(text: str) -> List[str]:
+        __lines = [line for line in text.splitlines() if line.strip()]
+        if len(__lines) == 0:
+            return []
+        try:
+            __dialect = csv.Sniffer().sniff(__lines[0], delimiters=",;\t")
+        except csv.Error:
+            __dialect = csv.excel
+        __header = [v.strip().lower() for v in next(csv.reader([__lines[0]], __dialect))]
+        if "question" in __header:
+            __column = __header.index("question")
+            __rows = [row for row in csv.reader(StringIO(text), __dialect) if len(row) > 0]
+            return [row[__column] for row in __rows[1:] if len(row) > __column]
+        # without a header every line is a question, commas included - quotes around a single field are removed
+        __questions = []
+        for line in __lines:
+            __fields = next(csv.reader([line], __dialect))
+            __questions.append(__fields[0] if len(__fields) == 1 else line)
+        return __questions
+
+    @staticmethod
+    def __decode(content: bytes) -> str:
+        # files saved by Excel on Windows are often not UTF-8
+        try:
+            return content.decode("utf-8-sig")
+        except UnicodeDecodeError:
+            return content.decode("cp1252", errors="replace")
+
+    def __answer_questions(self, questions: List[str], table) -> pd.DataFrame:
+        # answers are shown as they arrive, in the order of the questionnaire - the connector limits the request rate
+        __semantha = state.get_semantha()
+        __rows: Dict[int, Dict[str, str]] = {}
+        __progress = st.progress(0.0, text=f"Answering {len(questions)} questions...")
+        with ThreadPoolExecutor(max_workers=self.__QUESTIONNAIRE_WORKERS) as executor:
+            __futures = {executor.submit(self.__answer_question, __semantha, q): i for i, q in enumerate(questions)}
+            for future in as_completed(__futures):
+                __rows[__futures[future]] = future.result()
+                __progress.progress(len(__rows) / len(questions),
+                                    text=f"Answered {len(__rows)} of {len(questions)} questions...")
+                table.dataframe(self.__to_table([__rows[i] for i in sorted(__rows)]), use_container_width=True)
+        __progress.empty()
+        __results = self.__to_table([__rows[i] for i in range(len(questions))])
+        __failed = int((__results["Error"] != "").sum())
+        if __failed > 0:
+            st.warning(f"{__failed} of {len(questions)} questions could not be answered.")
+        return __results
+
+    def __answer_question(self, semantha, question: str) -> Dict[str, str]:
+        # runs on a worker thread, so no streamlit calls here
+        try:
+            __answer = semantha.generate_retrieval_augmented_answer(question)
+            __references = __answer.references or []
+            __topics = dict.fromkeys(
+                t for r in __references for t in semantha.get_tags_of_library_document(r.id)[:1]
+            )
+            return {
+                "Question": question,
+                "Answer": self.__strip_references(__answer.answer or "").strip(),
+                "References": "; ".join(r.name for r in __references),
+                "Topics": "; ".join(__topics),
+                "Error": ""
+            }
+        except Exception as e:
+            logging.exception(f"Answering '{question}' failed")
+            return {"Question": question, "Answer": "", "References": "", "Topics": "",
+                    "Error": f"{type(e).__name__}: {e}"}
+
+    def __to_table(self, rows: List[Dict[str, str]]) -> pd.DataFrame:
+        return pd.DataFrame.from_records(rows, columns=self.__QUESTIONNAIRE_COLUMNS)
@@ -1,13 +1,15 @@
 from typing import List
 
+import pandas as pd
 import streamlit as st
 
 import state
-from pages_views.abstract_pages import AbstractSidebar
+from pages_views.abstract_pages import AbstractPage, AbstractSidebar
+from util.text_handling import human_readable_size
 
 
 class CompareSidebar(AbstractSidebar):
-    __THRESHOLD_RELAXED = 0.65
+    __THRESHOLD_RELAXED = state.CONST_COMPARISON_THRESHOLD
     __THRESHOLD_MEDIUM = 0.7
     __THRESHOLD_STRICT = 0.75
     __THRESHOLD_RELAXED_NAME = 'Relaxed'
@@ -43,17 +45,13 @@ class CompareSidebar(AbstractSidebar):
 
 
 class CompareSidebarWithTagFilter(CompareSidebar):
-    def __init__(self):
-        super().__init__()
-        self.__options = _prepare_lib_tags_as_filter_options()
-        self.__default = state.get_selected_tags_compare_view()
 
     def _display_extras(self):
         if state.get_single_document_with_references()[1] is not None:
             with st.expander("Filter settings", True):
                 __selected = st.multiselect(label="Select topics to include in visualizations",
-                                            default=self.__default,
-                                            options=self.__options,
+                                            default=state.get_selected_tags_compare_view(),
+                                            options=_prepare_lib_tags_as_filter_options(),
                                             key="dashboard_sidebar_multiselect")
             __update_button = st.button("Update visualizations")
             if __update_button:
@@ -140,9 +138,41 @@ class HowToSidebar(AbstractSidebar):
         st.write("_The sidebar can be used to adjust settings ..._")
 
 
+class DiagnosticsSidebar(AbstractPage):
+
+    def display_page(self):
+        with st.sidebar:
+            with st.expander("Diagnostics", False):
+                self._display_content()
+
+    def _display_content(self):
+        __metrics = state.get_metrics()
+        __calls = pd.DataFrame.from_records(__metrics.get_snapshot())
+        if len(__calls) == 0:
+            st.write("_No backend calls yet._")
+        else:
+            st.write("__Backend calls__")
+            st.dataframe(pd.DataFrame({
+                "Backend": __calls["backend"],
+                "Method": __calls["method"],
+                "Calls": __calls["calls"],
+                "Errors": __calls["errors"],
+                "Cache hits": __calls["cache_hits"],
+                "Avg ms": (1000 * __calls["seconds"] / __calls["calls"]).round(1),
+                "Max ms": (1000 * __calls["max_seconds"]).round(1),
+                "Sent": __calls["bytes_sent"].map(human_readable_size),
+                "Received": __calls["bytes_received"].map(human_readable_size)
+            }), hide_index=True, use_container_width=True)
+        __cache_stats = state.get_semantha().cache.get_stats()
+        if len(__cache_stats) > 0:
+            st.write("__semantha cache__")
+            st.dataframe(pd.DataFrame.from_dict(__cache_stats, orient="index"), use_container_width=True)
+        st.download_button("Download metrics", __metrics.to_prometheus(), file_name="kate-one-metrics.prom",
+                           mime="text/plain", key="diagnostics_download")
+
+
 def _prepare_lib_tags_as_filter_options() -> List[str]:
-    __options = state.get_semantha().get_library_tags()
-    if __options is None:
-        __options = []
+    # the connector hands out its cached list, so it is copied before appending
+    __options = list(state.get_semantha().get_library_tags() or [])
     __options.append(state.NO_TAG)
     return __options
@@ -1,77 +1,375 @@
+import asyncio
+import functools
+import hashlib
 import logging
-from io import IOBase
-from typing import List
+import pickle
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO, IOBase
+from typing import Any, Awaitable, Dict, Iterable, List
 
-import semantha_sdk
-import streamlit as st
 from semantha_sdk.model.document_class import DocumentClass
-from semantha_sdk.model.document_information import DocumentInformation
+from semantha_sdk.model.entity import Entity
+
+from util.call_metrics import CallMetrics, instrumented
+from util.category_tree import CategoryTree
+from util.connector_cache import ConnectorCache
+from util.disk_cache import DiskCache
+from util.library_index import LibraryEntry, LibraryIndex
+from util.pooled_rest_client import login
+from util.rate_limiter import RateLimiter
+from util.pdf_split import PdfChunk, can_split_pdf, is_pdf, split_pdf
+from util.semantha_model_handling import get_paragraphs_of_doc, merge_documents
+from util.single_flight import SingleFlight
+from util.text_handling import normalize_question
+
+
+def _cached(name: str, key_args: int = None):
+    # results are kept in the connector's cache under the given name and the call arguments (the first key_args of
+    # them if given), concurrent misses for the same arguments share one backend call
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(self, *args):
+            __key = tuple(tuple(a) if isinstance(a, list) else a for a in args[:key_args])
+            __computed = []
+
+            def compute():
+                __computed.append(True)
+                return fn(self, *args)
+
+            __result = self.flights.do((name, __key), lambda: self.cache.get_or_compute(name, __key, compute))
+            self.metrics.mark_cache_hit(len(__computed) == 0)
+            return __result
+        return wrapper
+    return decorator
 
 
 class SemanthaConnector:
 
     __STOP_TOKENS = ["References:", "Reference:"]
+    __LIBRARY_PAGE_SIZE = 1000
+    __LIBRARY_FIELDS = "id,name,tags,derivedtags,documentclass,contentpreview"
+    __PARAGRAPH_FETCH_WORKERS = 4
+    __LIBRARY_CHECK_INTERVAL = 300
+    __CHUNK_COMPARE_WORKERS = 4
+    __ANSWER_MAX_REFERENCES = 5
+    __ANSWER_SIMILARITY_THRESHOLD = 0.4
+    __CACHE_TTLS = {
+        "library_index": 3600,
+        "library_tags": 3600,
+        "library_paragraphs": 3600,
+        "category": 3600,
+        "category_tree": 3600,
+        "summary": 24 * 3600
+    }
+    # cached results that depend on the content of the library
+    __LIBRARY_CACHES = ["library_index", "library_tags", "library_paragraphs", "category", "category_tree", "answer"]
 
-    def __init__(self, server, key, domain):
+    def __init__(self, server, key, domain, result_cache: DiskCache = None, pool_size: int = 10,
+                 cache_max_bytes: int = 256 * 1024 * 1024, metrics: CallMetrics = None, split_pages: int = 0,
+                 answer_cache: DiskCache = None, answer_ttl: int = 7 * 24 * 3600,
+                 answer_rate_limiter: RateLimiter = None):
         logging.info("Authenticating semantha ...")
-        self.__sdk = semantha_sdk.login(
-            server_url=server, key=key
+        self.__metrics = metrics if metrics is not None else CallMetrics()
+        self.__sdk = login(
+            server_url=server, key=key, pool_size=pool_size, metrics=self.__metrics
         )
         self.__domain = domain
+        self.__result_cache = result_cache
+        self.__answer_cache = answer_cache
+        self.__answer_ttl = answer_ttl
+        # generated answers are expensive for the server, their rate is limited across all sessions
+        self.__answer_rate_limiter = answer_rate_limiter
+        # PDFs with more pages are compared in page ranges of this size, 0 compares every document as a whole
+        self.__split_pages = split_pages if can_split_pdf() else 0
+        if split_pages > 0 and self.__split_pages == 0:
+            logging.warning("pypdfium2 is not installed, large documents are compared as a whole")
+        # answers are kept in memory no longer than on disk
+        self.__cache = ConnectorCache(cache_max_bytes, dict(self.__CACHE_TTLS, answer=answer_ttl))
+        self.__flights = SingleFlight()
+        self.__library_fingerprint = None
+        self.__library_checked_at = None
         logging.info("... successful!")
 
-    def compare_to_library(self, in_file: IOBase, threshold: float):
+    @property
+    def cache(self) -> ConnectorCache:
+        return self.__cache
+
+    @property
+    def flights(self) -> SingleFlight:
+        return self.__flights
+
+    @property
+    def metrics(self) -> CallMetrics:
+        return self.__metrics
+
+    @property
+    def split_pages(self) -> int:
+        return self.__split_pages
+
+    def get_library_fingerprint(self) -> str:
+        # count and latest update of the library documents, results computed for another state are outdated
+        self.check_library_for_changes()
+        return str(self.__library_fingerprint)
+
+    def invalidate_library(self):
+        logging.info("Invalidating cached library data")
+        self.__cache.invalidate(*self.__LIBRARY_CACHES)
+
+    @instrumented("semantha")
+    def check_library_for_changes(self) -> bool:
+        # compares count and latest update of the library documents, at most every __LIBRARY_CHECK_INTERVAL seconds
+        if self.__library_checked_at is not None and \
+                time.monotonic() - self.__library_checked_at < self.__LIBRARY_CHECK_INTERVAL:
+            return False
+        return self.__flights.do(("library_check",), self.__check_library_for_changes)
+
+    def __check_library_for_changes(self) -> bool:
+        __page = self.__sdk.domains(domainname=self.__domain).referencedocuments.get(
+            offset=0, limit=1, sort="-updated", fields="id,updated"
+        )
+        __latest = __page.data[0].updated if __page.data else None
+        __total = __page.meta.page.total if __page.meta is not None and __page.meta.page is not None else None
+        __fingerprint = (__total, __latest)
+        __changed = self.__library_fingerprint is not None and __fingerprint != self.__library_fingerprint
+        self.__library_fingerprint = __fingerprint
+        self.__library_checked_at = time.monotonic()
+        if __changed:
+            self.invalidate_library()
+        return __changed
+
+    @instrumented("semantha")
+    def compare_to_library(self, in_file: IOBase, threshold: float, max_references: int = 1):
+        __content = in_file.read()
+        # a comparison is only valid for the library state it was made against
+        __key = f"{hashlib.sha256(__content).hexdigest()}|{self.__domain}|{threshold}|{max_references}|" \
+                f"{self.__split_pages}|{self.get_library_fingerprint()}"
+        return self.__flights.do(("compare", __key), lambda: self.__compare(
+            __content, getattr(in_file, "name", None), __key, threshold, max_references
+        ))
+
+    def __compare(self, content: bytes, file_name: str, key: str, threshold: float, max_references: int):
+        if self.__result_cache is not None:
+            __cached = self.__result_cache.get_bytes(key)
+            self.__metrics.mark_cache_hit(__cached is not None)
+            if __cached is not None:
+                logging.info(f"Serving comparison of '{file_name}' from the result cache")
+                return pickle.loads(__cached)
+        __buffered_file = BytesIO(content)
+        if file_name is not None:
+            # semantha derives the document type from the file name
+            __buffered_file.name = file_name
+        __chunks = split_pdf(content, self.__split_pages) if self.__split_pages > 0 and is_pdf(content) else []
+        if len(__chunks) > 1:
+            __doc = self.__compare_chunks(__chunks, file_name, threshold, max_references)
+        else:
+            __doc = self.__post_references(__buffered_file, threshold, max_references)
+        if self.__result_cache is not None:
+            self.__result_cache.put_bytes(key, pickle.dumps(__doc))
+        return __doc
+
+    def __compare_chunks(self, chunks: List[PdfChunk], file_name: str, threshold: float, max_references: int):
+        logging.info(f"Comparing '{file_name}' in {len(chunks)} page ranges of up to {self.__split_pages} pages")
+
+        def compare(chunk: PdfChunk):
+            __chunk_file = BytesIO(chunk.content)
+            __chunk_file.name = file_name or "document.pdf"
+            return chunk.first_page, chunk.page_count, self.__post_references(__chunk_file, threshold, max_references)
+
+        with ThreadPoolExecutor(max_workers=min(len(chunks), self.__CHUNK_COMPARE_WORKERS)) as executor:
+            return merge_documents(list(executor.map(compare, chunks)), file_name)
+
+    def __post_references(self, in_file: IOBase, threshold: float, max_references: int):
         return self.__sdk.domains(domainname=self.__domain).references.post(
             file=in_file,
             similaritythreshold=threshold,
-            maxreferences=1
+            maxreferences=max_references
         )
 
-    @st.cache_data(show_spinner=False)
-    def get_text_of_library_paragraph(_self, doc_id: str, par_id: str) -> str:
-        return _self.__sdk.domains(domainname=_self.__domain)\
-            .referencedocuments(documentid=doc_id).paragraphs(id=par_id).get().text
-
-    @st.cache_data(show_spinner=False)
-    def get_tags_of_library_document(_self, doc_id: str) -> List[str]:
-        __tags = _self.__sdk.domains(domainname=_self.__domain).referencedocuments(documentid=doc_id).get().tags
-        __derived_tags = _self.__sdk.domains(domainname=_self.__domain)\
-            .referencedocuments(documentid=doc_id).get().derived_tags
-        return __tags + __derived_tags
-
-    @st.cache_data(show_spinner=False)
-    def get_library_tags(_self) -> List[str]:
-        return _self.__sdk.domains(domainname=_self.__domain).tags.get()
-
-    @st.cache_data(show_spinner=False)
-    def get_library_entries_for_tag(_self, tag) -> List[DocumentInformation]:
-        return _self.__sdk.domains(domainname=_self.__domain).referencedocuments.get(
-            tags=tag, fields="id,name,contentpreview"
-        ).data
-
-    @st.cache_data(show_spinner=False)
-    def get_category_of_document(_self, doc_id: str) -> DocumentClass:
-        return _self.__sdk.domains(domainname=_self.__domain).referencedocuments(documentid=doc_id).get().document_class
-
-    @st.cache_data(show_spinner=False)
-    def get_category_by_id(_self, category_id: str) -> DocumentClass:
-        return _self.__sdk.domains(domainname=_self.__domain).documentclasses(id=category_id).get()
-
-    @st.cache_data(show_spinner=False)
-    def generate_retrieval_augmented_answer(_self, question: str):
-        return _self.__sdk.domains(domainname=_self.__domain).answers.post(
+    @instrumented("semantha")
+    def get_text_of_library_paragraph(self, doc_id: str, par_id: str) -> str:
+        __texts = self.__get_library_paragraphs(doc_id)
+        if par_id not in __texts:
+            logging.info(f"Paragraph '{par_id}' not part of library document '{doc_id}', fetching it ...")
+            return self.__sdk.domains(domainname=self.__domain)\
+                .referencedocuments(documentid=doc_id).paragraphs(id=par_id).get().text
+        return __texts[par_id]
+
+    @instrumented("semantha")
+    def prefetch_library_paragraphs(self, doc_ids: Iterable[str]):
+        # one request per library document instead of one per paragraph
+        __missing = [
+            doc_id for doc_id in dict.fromkeys(doc_ids) if not self.__cache.contains("library_paragraphs", (doc_id,))
+        ]
+        if len(__missing) == 0:
+            return
+        with ThreadPoolExecutor(max_workers=self.__PARAGRAPH_FETCH_WORKERS) as executor:
+            list(executor.map(self.__get_library_paragraphs, __missing))
+
+    @instrumented("semantha")
+    @_cached("library_paragraphs")
+    def __get_library_paragraphs(self, doc_id: str) -> Dict[str, str]:
+        __doc = self.__sdk.domains(domainname=self.__domain).referencedocuments(documentid=doc_id).get()
+        return {p.id: p.text for p in get_paragraphs_of_doc(__doc)}
+
+    @instrumented("semantha")
+    def get_library_index(self) -> LibraryIndex:
+        self.check_library_for_changes()
+        return self.__get_library_index()
+
+    @_cached("library_index")
+    def __get_library_index(self) -> LibraryIndex:
+        __index = LibraryIndex()
+        __offset = 0
+        while True:
+            __page = self.__sdk.domains(domainname=self.__domain).referencedocuments.get(
+                offset=__offset, limit=self.__LIBRARY_PAGE_SIZE, fields=self.__LIBRARY_FIELDS
+            )
+            __docs = __page.data or []
+            for doc in __docs:
+                __index.add(doc)
+            __offset += len(__docs)
+            __total = __page.meta.page.total if __page.meta is not None and __page.meta.page is not None else None
+            if len(__docs) < self.__LIBRARY_PAGE_SIZE or (__total is not None and __offset >= __total):
+                break
+        logging.info(f"Indexed {len(__index)} library documents")
+        return __index
+
+    @instrumented("semantha")
+    def get_tags_of_library_document(self, doc_id: str) -> List[str]:
+        return self.__get_library_index_with(doc_id).get_tags(doc_id)
+
+    @instrumented("semantha")
+    @_cached("library_tags")
+    def get_library_tags(self) -> List[str]:
+        return self.__sdk.domains(domainname=self.__domain).tags.get()
+
+    @instrumented("semantha")
+    def get_library_entries_for_tag(self, tag) -> List[LibraryEntry]:
+        return self.get_library_index().get_entries_for_tag(tag)
+
+    @instrumented("semantha")
+    def get_category_of_document(self, doc_id: str) -> Entity:
+        return self.__get_library_index_with(doc_id).get_category(doc_id)
+
+    def __get_library_index_with(self, doc_id: str) -> LibraryIndex:
+        # documents added to the library after the index was built are fetched once and added to the index
+        __index = self.get_library_index()
+        if doc_id not in __index:
+            logging.info(f"Library document '{doc_id}' not indexed yet, fetching it ...")
+            __doc = self.__sdk.domains(domainname=self.__domain).referencedocuments(documentid=doc_id).get()
+            __index.add(__doc)
+            self.__cache.grow("library_index", (), __doc)
+        return __index
+
+    @instrumented("semantha")
+    @_cached("category")
+    def get_category_by_id(self, category_id: str) -> DocumentClass:
+        return self.__sdk.domains(domainname=self.__domain).documentclasses(id=category_id).get()
+
+    @instrumented("semantha")
+    @_cached("category_tree")
+    def get_category_tree(self) -> CategoryTree:
+        return CategoryTree(self.__sdk.domains(domainname=self.__domain).documentclasses.get())
+
+    @instrumented("semantha")
+    def get_category_path(self, category_id: str) -> List[str]:
+        # names of the classes from the root class down to the given class
+        __tree = self.get_category_tree()
+        __missing = __tree.get_missing_ancestor(category_id)
+        while __missing is not None:
+            logging.info(f"Document class '{__missing}' not in category tree yet, fetching it ...")
+            __category = self.get_category_by_id(__missing)
+            __tree.add(__category)
+            self.__cache.grow("category_tree", (), __category)
+            __missing = __tree.get_missing_ancestor(category_id)
+        return [__tree.get_name(c) for c in __tree.get_path(category_id)]
+
+    @instrumented("semantha")
+    def generate_retrieval_augmented_answer(self, question: str):
+        # the library state is part of the key of stored answers
+        self.check_library_for_changes()
+        return self.__get_answer(normalize_question(question), " ".join(question.split()))
+
+    @_cached("answer", key_args=1)
+    def __get_answer(self, normalized_question: str, question: str):
+        # stored under the normalized question, semantha gets the question as asked first
+        __key = f"{normalized_question}|{self.__domain}|{self.__library_fingerprint}|{self.__ANSWER_MAX_REFERENCES}|" \
+                f"{self.__ANSWER_SIMILARITY_THRESHOLD}"
+        if self.__answer_cache is not None:
+            __cached = self.__answer_cache.get_bytes(__key)
+            __answer = None
+            if __cached is not None:
+                __created, __answer = pickle.loads(__cached)
+                if time.time() - __created >= self.__answer_ttl:
+                    self.__answer_cache.invalidate(__key)
+                    __answer = None
+            self.__metrics.mark_cache_hit(__answer is not None)
+            if __answer is not None:
+                return __answer
+        if self.__answer_rate_limiter is not None:
+            self.__answer_rate_limiter.acquire()
+        __answer = self.__sdk.domains(domainname=self.__domain).answers.post(
             question=question,
-            maxreferences=5,
-            similaritythreshold=0.4
+            maxreferences=self.__ANSWER_MAX_REFERENCES,
+            similaritythreshold=self.__ANSWER_SIMILARITY_THRESHOLD
         )
+        if self.__answer_cache is not None:
+            self.__answer_cache.put_bytes(__key, pickle.dumps((time.time(), __answer)))
+        return __answer
 
-    @st.cache_data(show_spinner=False)
-    def summarize(_self, sources: List[str], topic: str) -> str:
+    @instrumented("semantha")
+    @_cached("summary")
+    def summarize(self, sources: List[str], topic: str) -> str:
         __sources_with_refs = [f"[{i + 1}] {s}" for i, s in enumerate(sources)]
-        resp = _self.__sdk.domains(domainname=_self.__domain).summarizations.post(
+        resp = self.__sdk.domains(domainname=self.__domain).summarizations.post(
             topic=topic,
             texts=__sources_with_refs
         )
-        for token in _self.__STOP_TOKENS:
+        for token in self.__STOP_TOKENS:
             resp = resp.split(token, maxsplit=1)[0]
         return resp.strip()
+
+
+# asyncio variant of the connector - the semantha sdk is blocking, so the calls run on a thread pool that shares the
+# connector's pooled http session; run() is the synchronous entry point for the streamlit scripts
+class AsyncSemanthaConnector:
+
+    def __init__(self, connector: SemanthaConnector, max_workers: int = 10):
+        self.__connector = connector
+        self.__executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="semantha")
+
+    def run(self, *calls: Awaitable) -> List[Any]:
+        async def __gather():
+            return await asyncio.gather(*calls)
+        return asyncio.run(__gather())
+
+    async def compare_to_library(self, in_file: IOBase, threshold: float, max_references: int = 1):
+        return await self.__call(self.__connector.compare_to_library, in_file, threshold, max_references)
+
+    async def get_text_of_library_paragraph(self, doc_id: str, par_id: str) -> str:
+        return await self.__call(self.__connector.get_text_of_library_paragraph, doc_id, par_id)
+
+    async def prefetch_library_paragraphs(self, doc_ids: Iterable[str]):
+        return await self.__call(self.__connector.prefetch_library_paragraphs, list(doc_ids))
+
+    async def get_library_index(self) -> LibraryIndex:
+        return await self.__call(self.__connector.get_library_index)
+
+    async def get_tags_of_library_document(self, doc_id: str) -> List[str]:
+        return await self.__call(self.__connector.get_tags_of_library_document, doc_id)
+
+    async def get_library_tags(self) -> List[str]:
+        return await self.__call(self.__connector.get_library_tags)
+
+    async def get_category_tree(self) -> CategoryTree:
+        return await self.__call(self.__connector.get_category_tree)
+
+    async def generate_retrieval_augmented_answer(self, question: str):
+        return await self.__call(self.__connector.generate_retrieval_augmented_answer, question)
+
+    async def summarize(self, sources: List[str], topic: str) -> str:
+        return await self.__call(self.__connector.summarize, sources, topic)
+
+    async def __call(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.__executor, functools.partial(fn, *args))
@@ -1,18 +1,116 @@
+import logging
+import os
+from io import BytesIO
+from typing import Iterable
+
+import pandas as pd
 import streamlit as st
 from snowflake.snowpark import FileOperation
 
+from util.call_metrics import CallMetrics, instrumented
+from util.disk_cache import DiskCache
+from util.single_flight import SingleFlight
+
 
 class SnowparkConnector:
+    __LISTING_TTL = 60
+    __SORT_COLUMNS = {
+        "name": "relative_path",
+        "size": "size",
+        "last_modified": "last_modified"
+    }
 
-    def __init__(self, **kwargs):
+    def __init__(self, download_cache: DiskCache = None, metrics: CallMetrics = None, **kwargs):
         self.__stage = kwargs.pop("stage")
+        self.__download_cache = download_cache
+        self.__metrics = metrics if metrics is not None else CallMetrics()
         self.__connection = st.experimental_connection('snowpark', **kwargs)
+        self.__flights = SingleFlight()
+
+    @property
+    def flights(self) -> SingleFlight:
+        return self.__flights
+
+    @property
+    def metrics(self) -> CallMetrics:
+        return self.__metrics
+
+    @instrumented("snowflake")
+    def get_document(self, doc_name: str, md5: str = None, last_modified=None):
+        # md5 and last_modified from the directory table identify the version of a cached download, concurrent
+        # requests for the same version share one download and get a stream each
+        __key = f"{self.__stage}/{doc_name}|{md5}|{last_modified}"
+        __cacheable = self.__download_cache is not None and (md5 is not None or last_modified is not None)
+        __content = self.__flights.do(("document", __key), lambda: self.__get_content(doc_name, __key, __cacheable))
+        __stream = BytesIO(__content)
+        __stream.name = os.path.basename(doc_name)
+        return __stream
+
+    def __get_content(self, doc_name: str, key: str, cacheable: bool) -> bytes:
+        __content = self.__download_cache.get_bytes(key) if cacheable else None
+        if cacheable:
+            self.__metrics.mark_cache_hit(__content is not None)
+        if __content is None:
+            logging.info(f"Downloading '{doc_name}' from stage '{self.__stage}'")
+            with self.__download(doc_name) as f:
+                __content = f.read()
+            self.__metrics.add_payload(0, len(__content))
+            if cacheable:
+                self.__download_cache.put_bytes(key, __content)
+        return __content
 
-    def get_document(self, doc_name: str):
+    def __download(self, doc_name: str):
         with self.__connection.safe_session() as session:
             down_file = FileOperation(session).get_stream(stage_location=f'@{self.__stage}/' + doc_name)
             return down_file
 
+    @instrumented("snowflake")
     def get_list_of_file_names(self, limit: int = 20):
-        res = self.__connection.query(f'SELECT relative_path FROM directory(@{self.__stage});', ttl=0)
-        return res['RELATIVE_PATH'].values.tolist()[:limit]
+        return self.list_files(limit=limit)['RELATIVE_PATH'].values.tolist()
+
+    @instrumented("snowflake")
+    def list_files(self, extensions: Iterable[str] = (), search: str = None, order_by: str = "name",
+                   descending: bool = False, limit: int = 20, offset: int = 0) -> pd.DataFrame:
+        # columns: RELATIVE_PATH, SIZE, LAST_MODIFIED, MD5
+        __order_column = self.__SORT_COLUMNS[order_by]
+        __direction = "DESC" if descending else "ASC"
+        return self.__query(
+            f"SELECT relative_path, size, last_modified, md5 FROM directory(@{self.__stage})"
+            f"{self.__where_clause(extensions, search)} "
+            f"ORDER BY {__order_column} {__direction}, relative_path LIMIT {int(limit)} OFFSET {int(offset)};"
+        )
+
+    @instrumented("snowflake")
+    def count_files(self, extensions: Iterable[str] = (), search: str = None) -> int:
+        res = self.__query(
+            f"SELECT COUNT(*) AS file_count FROM directory(@{self.__stage}){self.__where_clause(extensions, search)};"
+        )
+        return int(res['FILE_COUNT'].values[0])
+
+    def __query(self, sql: str) -> pd.DataFrame:
+        __result = self.__flights.do(
+            ("query", sql), lambda: self.__connection.query(sql, ttl=self.__LISTING_TTL)
+        )
+        self.__metrics.add_payload(len(sql), int(__result.memory_usage(deep=True).sum()))
+        return __result
+
+    @classmethod
+    def __where_clause(cls, extensions: Iterable[str], search: str) -> str:
+        __conditions = []
+        __extension_conditions = [
+            f"relative_path ILIKE '%{cls.__escape_like(ext)}' ESCAPE '^'" for ext in extensions
+        ]
+        if len(__extension_conditions) > 0:
+            __conditions.append("(" + " OR ".join(__extension_conditions) + ")")
+        if search:
+            __conditions.append(f"relative_path ILIKE '%{cls.__escape_like(search)}%' ESCAPE '^'")
+        if len(__conditions) == 0:
+            return ""
+        return " WHERE " + " AND ".join(__conditions)
+
+    @staticmethod
+    def __escape_like(value: str) -> str:
+        # LIKE wildcards are escaped with '^', quotes and backslashes for the string literal
+        for char in ["^", "%", "_"]:
+            value = value.replace(char, "^" + char)
+        return value.replace("\\", "\\\\").replace("'", "''")
@@ -1,10 +1,20 @@
 import logging
+import os
+import threading
+from typing import TYPE_CHECKING, Dict, Optional
 
 import streamlit as st
 from semantha_sdk.model.document import Document
 
-from semantha import SemanthaConnector
-from snowpark_connection import SnowparkConnector
+from semantha import AsyncSemanthaConnector, SemanthaConnector
+from util.analysis_store import AnalysisStore, analysis_scope
+from util.call_metrics import CallMetrics
+from util.disk_cache import DiskCache
+from util.rate_limiter import RateLimiter
+from util.semantha_model_handling import CompactDocument, ParagraphIndex
+
+if TYPE_CHECKING:
+    from snowpark_connection import SnowparkConnector
 
 CONST_HIGH_SIM = 0.95
 CONST_MID_SIM = 0.80
@@ -12,6 +22,26 @@ CONST_HIGH_SIM_COLOR = "#95C23D"
 CONST_MID_SIM_COLOR = "#FDD835"
 CONST_LOW_SIM_COLOR = "#CCCCCC"
 NO_TAG = "(no tag)"
+# single documents are compared once at the most relaxed strictness and filtered locally for stricter ones
+CONST_COMPARISON_THRESHOLD = 0.65
+DEFAULT_SEMANTHA_POOL_SIZE = 10
+DEFAULT_SEMANTHA_CACHE_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "kate-one")
+DEFAULT_RESULT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_DOWNLOAD_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+DEFAULT_PREVIEW_CACHE_MAX_BYTES = 128 * 1024 * 1024
+DEFAULT_ANALYSIS_STORE_MAX_BYTES = 1024 * 1024 * 1024
+DEFAULT_METRICS_EXPORT_INTERVAL = 15
+DEFAULT_METRICS_HOST = "127.0.0.1"
+DEFAULT_ANSWER_CACHE_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_ANSWER_TTL = 7 * 24 * 3600
+DEFAULT_ANSWER_RATE_LIMIT = 2.0
+DEFAULT_ANSWER_RATE_BURST = 4
+DEFAULT_ANALYSIS_WORKERS = 4
+RAG_EXAMPLE_QUESTIONS = [
+    "What do we have to be careful of concerning personal data?",
+    "How should ESG solutions adapt to changing demands of stakeholders and regulators?"
+]
 
 __semantha = None
 __snowpark = None
@@ -30,12 +60,24 @@ def __init_documents_with_references():
         st.session_state.__documents_with_references = []
 
 
+def __init_paragraph_indices():
+    if "__paragraph_indices" not in st.session_state:
+        logging.info("No state for 'paragraph_indices' found, initializing with empty dict.")
+        st.session_state.__paragraph_indices = {}
+
+
 def __init_similarity_threshold():
     if "__similarity_threshold" not in st.session_state:
         logging.info("No state for 'similarity_threshold' found, initializing with '0.0'.")
         st.session_state.__similarity_threshold = 0.0
 
 
+def __init_questionnaire_results():
+    if "__questionnaire_results" not in st.session_state:
+        logging.info("No state for 'questionnaire_results' found, initializing with 'None'.")
+        st.session_state.__questionnaire_results = None
+
+
 def __init_selected_tags_compare_view():
     if "__selected_tags_compare_view" not in st.session_state:
         logging.info("No state for 'selected_tags_compare_view' found, initializing with empty list.")
@@ -81,6 +123,54 @@ def __init_tag_for_summarization():
         st.session_state.__tag_for_summarization = None
 
 
+def create_disk_cache(cache_settings: Dict, name: str, default_max_bytes: int) -> DiskCache:
+    # optional [cache] secrets section with 'dir' and '<name>_max_bytes', the batch analysis passes its own
+    return DiskCache(
+        os.path.join(cache_settings.get("dir", DEFAULT_CACHE_DIR), name),
+        int(cache_settings.get(f"{name}_max_bytes", default_max_bytes))
+    )
+
+
+def create_analysis_store(cache_settings: Dict) -> AnalysisStore:
+    # the app and the batch analysis share the store, so both reuse each other's results
+    return AnalysisStore(
+        os.path.join(cache_settings.get("dir", DEFAULT_CACHE_DIR), "analyses"),
+        int(cache_settings.get("analyses_max_bytes", DEFAULT_ANALYSIS_STORE_MAX_BYTES))
+    )
+
+
+def __get_disk_cache(name: str, default_max_bytes: int) -> DiskCache:
+    return create_disk_cache(st.secrets.get("cache", {}), name, default_max_bytes)
+
+
+@st.cache_resource(show_spinner=False)
+def get_metrics() -> CallMetrics:
+    # optional [metrics] secrets section with 'prometheus_file', 'prometheus_port', 'prometheus_host' (only the local
+    # host by default) and 'export_interval'
+    __settings = st.secrets.get("metrics", {})
+    __metrics = CallMetrics()
+    if __settings.get("prometheus_file"):
+        __metrics.start_file_export(
+            __settings["prometheus_file"], float(__settings.get("export_interval", DEFAULT_METRICS_EXPORT_INTERVAL))
+        )
+    if __settings.get("prometheus_port"):
+        __metrics.start_http_export(int(__settings["prometheus_port"]),
+                                    __settings.get("prometheus_host", DEFAULT_METRICS_HOST))
+    return __metrics
+
+
+def __get_answer_rate_limiter(semantha) -> Optional[RateLimiter]:
+    # answer_rate_limit = 0 turns the limit off
+    __rate = float(semantha.get("answer_rate_limit", DEFAULT_ANSWER_RATE_LIMIT))
+    if __rate <= 0:
+        return None
+    return RateLimiter(__rate, int(semantha.get("answer_rate_burst", DEFAULT_ANSWER_RATE_BURST)))
+
+
+def get_diagnostics_enabled() -> bool:
+    return bool(st.secrets.get("metrics", {}).get("diagnostics", False))
+
+
 @st.cache_resource(show_spinner=False)
 def get_semantha() -> SemanthaConnector:
     global __semantha
@@ -88,19 +178,76 @@ def get_semantha() -> SemanthaConnector:
         logging.warning("SemanthaConnector is None, recreating...")
         semantha = st.secrets.semantha
         __semantha = SemanthaConnector(semantha.server_url, semantha.api_key,
-                                       semantha.domain)
+                                       semantha.domain, __get_disk_cache("results", DEFAULT_RESULT_CACHE_MAX_BYTES),
+                                       int(semantha.get("pool_size", DEFAULT_SEMANTHA_POOL_SIZE)),
+                                       int(semantha.get("cache_max_bytes", DEFAULT_SEMANTHA_CACHE_MAX_BYTES)),
+                                       get_metrics(), int(semantha.get("split_pages", 0)),
+                                       __get_disk_cache("answers", DEFAULT_ANSWER_CACHE_MAX_BYTES),
+                                       int(semantha.get("answer_ttl", DEFAULT_ANSWER_TTL)),
+                                       __get_answer_rate_limiter(semantha))
     return __semantha
 
 
 @st.cache_resource(show_spinner=False)
-def get_snowpark() -> SnowparkConnector:
+def warm_up_answers():
+    # once per server process, the example questions of the Q&A page are answered in the background
+    if not st.secrets.semantha.get("warm_up_answers", True):
+        return None
+    __semantha = get_semantha()
+
+    def warm_up():
+        for question in RAG_EXAMPLE_QUESTIONS:
+            try:
+                __semantha.generate_retrieval_augmented_answer(question)
+            except Exception:
+                logging.exception(f"Warming up the answer to '{question}' failed")
+
+    __thread = threading.Thread(target=warm_up, name="answer-warm-up", daemon=True)
+    __thread.start()
+    return __thread
+
+
+def get_analysis_workers() -> int:
+    # documents of a collection compared at the same time, at most one per pooled semantha connection
+    __semantha = st.secrets.semantha
+    __pool_size = int(__semantha.get("pool_size", DEFAULT_SEMANTHA_POOL_SIZE))
+    return max(1, min(int(__semantha.get("analysis_workers", DEFAULT_ANALYSIS_WORKERS)), __pool_size))
+
+
+@st.cache_resource(show_spinner=False)
+def get_semantha_async() -> AsyncSemanthaConnector:
+    return AsyncSemanthaConnector(
+        get_semantha(), int(st.secrets.semantha.get("pool_size", DEFAULT_SEMANTHA_POOL_SIZE))
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def get_snowpark() -> "SnowparkConnector":
     global __snowpark
     if __snowpark is None:
+        # Snowpark takes long to import and is only needed by the document collection
+        from snowpark_connection import SnowparkConnector
+
         logging.warning("SnowparkConnector is None, recreating...")
-        __snowpark = SnowparkConnector(**get_snowflake_cred_dict())
+        __snowpark = SnowparkConnector(download_cache=__get_disk_cache("downloads", DEFAULT_DOWNLOAD_CACHE_MAX_BYTES),
+                                       metrics=get_metrics(), **get_snowflake_cred_dict())
     return __snowpark
 
 
+@st.cache_resource(show_spinner=False)
+def get_preview_cache() -> DiskCache:
+    return __get_disk_cache("previews", DEFAULT_PREVIEW_CACHE_MAX_BYTES)
+
+
+@st.cache_resource(show_spinner=False)
+def get_analysis_store() -> AnalysisStore:
+    return create_analysis_store(st.secrets.get("cache", {}))
+
+
+def get_analysis_scope() -> str:
+    return analysis_scope(st.secrets.semantha.domain, get_snowflake_cred_dict())
+
+
 def set_page_id(page_id: int):
     __init_page_id()
     st.session_state.__page_id = int(page_id)
@@ -121,9 +268,14 @@ def get_similarity_threshold():
     return st.session_state.__similarity_threshold
 
 
+def __compact(doc):
+    # sessions only keep the matched paragraphs of analysis results
+    return CompactDocument.from_document(doc) if isinstance(doc, Document) else doc
+
+
 def add_document_with_references(doc: Document):
     __init_documents_with_references()
-    st.session_state.__documents_with_references.append(doc)
+    st.session_state.__documents_with_references.append(__compact(doc))
 
 
 def get_documents_with_references():
@@ -133,7 +285,19 @@ def get_documents_with_references():
 
 def reset_documents_with_references():
     __init_documents_with_references()
+    __init_paragraph_indices()
     st.session_state.__documents_with_references = []
+    st.session_state.__paragraph_indices = {}
+
+
+def get_paragraph_index(doc):
+    if isinstance(doc, CompactDocument):
+        # compacted documents carry the context windows of their matches
+        return doc
+    __init_paragraph_indices()
+    if doc.id not in st.session_state.__paragraph_indices:
+        st.session_state.__paragraph_indices[doc.id] = ParagraphIndex(doc)
+    return st.session_state.__paragraph_indices[doc.id]
 
 
 def set_selected_tags_compare_view(tags):
@@ -146,6 +310,16 @@ def get_selected_tags_compare_view():
     return st.session_state.__selected_tags_compare_view
 
 
+def set_questionnaire_results(results):
+    __init_questionnaire_results()
+    st.session_state.__questionnaire_results = results
+
+
+def get_questionnaire_results():
+    __init_questionnaire_results()
+    return st.session_state.__questionnaire_results
+
+
 def set_docs_with_refs_with_tags(doc_dict: dict):
     __init_docs_with_refs_with_tags()
     st.session_state.__docs_with_refs_with_tags = doc_dict
@@ -163,7 +337,7 @@ def reset_docs_with_refs_with_tags():
 
 def set_single_document_with_references(doc_name: str, document):
     __init_single_document_with_references()
-    st.session_state.__single_document_with_references = (doc_name, document)
+    st.session_state.__single_document_with_references = (doc_name, __compact(document))
 
 
 def get_single_document_with_references():
@@ -0,0 +1,142 @@
+import contextlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+import threading
+from typing import Dict, NamedTuple, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    # e.g. on Windows - saves of several processes are not coordinated there
+    fcntl = None
+
+from util.disk_cache import DiskCache
+from util.semantha_model_handling import CompactDocument
+
+
+def analysis_scope(domain: str, snowflake_settings: Dict) -> str:
+    # stored analyses are only valid for the same semantha domain and Snowflake stage
+    return "|".join(str(snowflake_settings.get(k)) for k in ["account", "database", "schema", "stage"]) + f"|{domain}"
+
+
+def analysis_parameters(threshold: float, max_references: int, split_pages: int, library_fingerprint: str) -> str:
+    # results of an older library state or other comparison settings are not reused
+    return f"threshold={threshold}|max_references={max_references}|split_pages={split_pages}|" \
+           f"library={library_fingerprint}"
+
+
+class ManifestEntry(NamedTuple):
+    md5: Optional[str]
+    last_modified: Optional[str]
+    parameters: str
+
+
+# manifest of analyzed files (path, md5 and last_modified as listed by the stage) per scope, with their compacted
+# results - a file only has to be compared again when it changed or the analysis parameters differ. The manifest is
+# shared by the app and batch analyses: saves merge into the one on disk, and changes of others are picked up
+class AnalysisStore:
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.__results = DiskCache(os.path.join(directory, "results"), max_bytes)
+        self.__manifest_path = os.path.join(directory, "manifest.json")
+        self.__lock_path = os.path.join(directory, "manifest.lock")
+        self.__lock = threading.Lock()
+        self.__manifest, self.__version = self.__load()
+        # entries put since the last save
+        self.__changes = {}
+
+    @staticmethod
+    def is_versioned(md5: Optional[str], last_modified) -> bool:
+        return md5 is not None or last_modified is not None
+
+    def get(self, scope: str, path: str, md5: Optional[str], last_modified, parameters: str) \
+            -> Optional[CompactDocument]:
+        __entry = ManifestEntry(md5, self.__as_str(last_modified), parameters)
+        with self.__lock:
+            self.__reload_if_changed()
+            __stored = self.__manifest.get(scope, {}).get(path)
+        if __stored is None or ManifestEntry(*__stored) != __entry:
+            return None
+        __data = self.__results.get_bytes(self.__result_key(scope, path, __entry))
+        # the result may have been evicted in the meantime
+        return pickle.loads(__data) if __data is not None else None
+
+    def put(self, scope: str, path: str, md5: Optional[str], last_modified, parameters: str, doc: CompactDocument):
+        # the manifest is only written by save()
+        __entry = ManifestEntry(md5, self.__as_str(last_modified), parameters)
+        self.__results.put_bytes(self.__result_key(scope, path, __entry), pickle.dumps(doc))
+        with self.__lock:
+            self.__manifest.setdefault(scope, {})[path] = list(__entry)
+            self.__changes.setdefault(scope, {})[path] = list(__entry)
+
+    def get_manifest(self, scope: str) -> Dict[str, ManifestEntry]:
+        with self.__lock:
+            self.__reload_if_changed()
+            return {path: ManifestEntry(*entry) for path, entry in self.__manifest.get(scope, {}).items()}
+
+    def save(self):
+        # the manifest on disk is read again under the file lock, so entries saved by others in the meantime are kept
+        with self.__lock:
+            if len(self.__changes) == 0:
+                return
+            with self.__file_lock():
+                __manifest, _ = self.__load()
+                self.__merge(__manifest, self.__changes)
+                __fd, __tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.__manifest_path), suffix=".tmp")
+                with os.fdopen(__fd, "w") as f:
+                    json.dump(__manifest, f)
+                os.replace(__tmp_path, self.__manifest_path)
+                self.__manifest = __manifest
+                self.__version = self.__get_version()
+            self.__changes = {}
+
+    def __reload_if_changed(self):
+        if self.__get_version() == self.__version:
+            return
+        self.__manifest, self.__version = self.__load()
+        # entries that are not saved yet take precedence
+        self.__merge(self.__manifest, self.__changes)
+
+    def __load(self) -> Tuple[Dict, Optional[Tuple[int, int]]]:
+        # the version is taken first - a save in between only causes another reload
+        __version = self.__get_version()
+        try:
+            with open(self.__manifest_path) as f:
+                return json.load(f), __version
+        except FileNotFoundError:
+            return {}, __version
+        except ValueError:
+            logging.exception(f"Manifest '{self.__manifest_path}' is corrupt, starting with an empty one")
+            return {}, __version
+
+    def __get_version(self) -> Optional[Tuple[int, int]]:
+        # saves replace the file, so the inode changes even if the modification time does not
+        try:
+            __stat = os.stat(self.__manifest_path)
+        except FileNotFoundError:
+            return None
+        return __stat.st_ino, __stat.st_mtime_ns
+
+    @contextlib.contextmanager
+    def __file_lock(self):
+        # released when the file is closed
+        with open(self.__lock_path, "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            yield
+
+    @staticmethod
+    def __merge(manifest: Dict, changes: Dict):
+        for scope, entries in changes.items():
+            manifest.setdefault(scope, {}).update(entries)
+
+    @staticmethod
+    def __result_key(scope: str, path: str, entry: ManifestEntry) -> str:
+        return "|".join([scope, path, str(entry.md5), str(entry.last_modified), entry.parameters])
+
+    @staticmethod
+    def __as_str(last_modified) -> Optional[str]:
+        return str(last_modified) if last_modified is not None else None
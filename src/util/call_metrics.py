@@ -0,0 +1,231 @@
+import functools
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+
+class _CallRecord:
+    __slots__ = ["cache_hit", "bytes_sent", "bytes_received"]
+
+    def __init__(self):
+        self.cache_hit = None
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+
+class _MethodMetrics:
+    __slots__ = ["calls", "errors", "cache_hits", "cache_misses", "seconds", "max_seconds", "bytes_sent",
+                 "bytes_received", "buckets"]
+
+    def __init__(self, bucket_count: int):
+        self.calls = 0
+        self.errors = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.buckets = [0] * bucket_count
+
+
+# timing, call, error, cache hit and payload counters per backend and connector method
+class CallMetrics:
+    DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+    __PREFIX = "kate_one_backend"
+
+    def __init__(self):
+        self.__metrics = {}
+        self.__lock = threading.Lock()
+        # the calls in progress of the current thread, innermost last
+        self.__local = threading.local()
+        self.__exporter = None
+        self.__server = None
+
+    @contextmanager
+    def measure(self, backend: str, method: str):
+        __record = _CallRecord()
+        __stack = self.__stack()
+        __stack.append(__record)
+        __start = time.perf_counter()
+        __error = False
+        try:
+            yield __record
+        except BaseException:
+            __error = True
+            raise
+        finally:
+            __stack.pop()
+            self.__add(backend, method, time.perf_counter() - __start, __record, __error)
+
+    def mark_cache_hit(self, hit: bool):
+        # applies to the innermost call in progress on this thread
+        __stack = self.__stack()
+        if len(__stack) > 0 and __stack[-1].cache_hit is None:
+            __stack[-1].cache_hit = hit
+
+    def add_payload(self, bytes_sent: int, bytes_received: int):
+        __stack = self.__stack()
+        if len(__stack) > 0:
+            __stack[-1].bytes_sent += bytes_sent
+            __stack[-1].bytes_received += bytes_received
+
+    def get_snapshot(self) -> List[Dict]:
+        with self.__lock:
+            return [
+                {
+                    "backend": backend,
+                    "method": method,
+                    "calls": m.calls,
+                    "errors": m.errors,
+                    "cache_hits": m.cache_hits,
+                    "cache_misses": m.cache_misses,
+                    "seconds": m.seconds,
+                    "max_seconds": m.max_seconds,
+                    "bytes_sent": m.bytes_sent,
+                    "bytes_received": m.bytes_received
+                }
+                for (backend, method), m in sorted(self.__metrics.items())
+            ]
+
+    def reset(self):
+        with self.__lock:
+            self.__metrics = {}
+
+    def to_prometheus(self) -> str:
+        with self.__lock:
+            __metrics = sorted(self.__metrics.items())
+            __lines = []
+            for name, help_text, attribute in [
+                ("calls_total", "Calls of connector methods.", "calls"),
+                ("errors_total", "Connector calls that raised an error.", "errors"),
+                ("cache_hits_total", "Connector calls served from a cache.", "cache_hits"),
+                ("cache_misses_total", "Connector calls that missed their cache.", "cache_misses")
+            ]:
+                __lines.append(f"# HELP {self.__PREFIX}_{name} {help_text}")
+                __lines.append(f"# TYPE {self.__PREFIX}_{name} counter")
+                for (backend, method), m in __metrics:
+                    __lines.append(f"{self.__PREFIX}_{name}{self.__labels(backend, method)} {getattr(m, attribute)}")
+            __lines.append(f"# HELP {self.__PREFIX}_payload_bytes_total Bytes exchanged with the backends.")
+            __lines.append(f"# TYPE {self.__PREFIX}_payload_bytes_total counter")
+            for (backend, method), m in __metrics:
+                for direction, value in [("sent", m.bytes_sent), ("received", m.bytes_received)]:
+                    __labels = self.__labels(backend, method, direction=direction)
+                    __lines.append(f"{self.__PREFIX}_payload_bytes_total{__labels} {value}")
+            __lines.append(f"# HELP {self.__PREFIX}_call_duration_seconds Duration of connector calls.")
+            __lines.append(f"# TYPE {self.__PREFIX}_call_duration_seconds histogram")
+            for (backend, method), m in __metrics:
+                __cumulative = 0
+                for bound, count in zip(self.DURATION_BUCKETS, m.buckets):
+                    __cumulative += count
+                    __labels = self.__labels(backend, method, le=str(bound))
+                    __lines.append(f"{self.__PREFIX}_call_duration_seconds_bucket{__labels} {__cumulative}")
+                __labels = self.__labels(backend, method, le="+Inf")
+                __lines.append(f"{self.__PREFIX}_call_duration_seconds_bucket{__labels} {m.calls}")
+                __labels = self.__labels(backend, method)
+                __lines.append(f"{self.__PREFIX}_call_duration_seconds_sum{__labels} {m.seconds}")
+                __lines.append(f"{self.__PREFIX}_call_duration_seconds_count{__labels} {m.calls}")
+        return "\n".join(__lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        # written atomically, e.g. for the textfile collector of the node exporter
+        __directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(__directory, exist_ok=True)
+        __fd, __tmp_path = tempfile.mkstemp(dir=__directory, suffix=".tmp")
+        try:
+            with os.fdopen(__fd, "w") as f:
+                f.write(self.to_prometheus())
+            os.replace(__tmp_path, path)
+        except BaseException:
+            os.unlink(__tmp_path)
+            raise
+
+    def start_file_export(self, path: str, interval: float = 15.0):
+        if self.__exporter is not None:
+            return
+
+        def export():
+            while True:
+                try:
+                    self.write_prometheus(path)
+                except OSError:
+                    logging.exception(f"Writing metrics to '{path}' failed")
+                time.sleep(interval)
+
+        logging.info(f"Exporting metrics to '{path}' every {interval} seconds")
+        self.__exporter = threading.Thread(target=export, name="metrics-export", daemon=True)
+        self.__exporter.start()
+
+    def start_http_export(self, port: int, host: str = "127.0.0.1"):
+        if self.__server is not None:
+            return
+        render = self.to_prometheus
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                content = render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args):
+                pass
+
+        logging.info(f"Serving metrics on {host}:{port}")
+        self.__server = ThreadingHTTPServer((host, port), Handler)
+        self.__server.daemon_threads = True
+        threading.Thread(target=self.__server.serve_forever, name="metrics-http", daemon=True).start()
+
+    def __stack(self) -> List[_CallRecord]:
+        if not hasattr(self.__local, "stack"):
+            self.__local.stack = []
+        return self.__local.stack
+
+    def __add(self, backend: str, method: str, seconds: float, record: _CallRecord, error: bool):
+        with self.__lock:
+            __metrics = self.__metrics.get((backend, method))
+            if __metrics is None:
+                __metrics = _MethodMetrics(len(self.DURATION_BUCKETS))
+                self.__metrics[(backend, method)] = __metrics
+            __metrics.calls += 1
+            __metrics.errors += int(error)
+            if record.cache_hit is not None:
+                __metrics.cache_hits += int(record.cache_hit)
+                __metrics.cache_misses += int(not record.cache_hit)
+            __metrics.seconds += seconds
+            __metrics.max_seconds = max(__metrics.max_seconds, seconds)
+            __metrics.bytes_sent += record.bytes_sent
+            __metrics.bytes_received += record.bytes_received
+            for i, bound in enumerate(self.DURATION_BUCKETS):
+                if seconds <= bound:
+                    __metrics.buckets[i] += 1
+                    break
+
+    @staticmethod
+    def __labels(backend: str, method: str, **extra: Optional[str]) -> str:
+        __labels = dict(backend=backend, method=method, **extra)
+        return "{" + ",".join(f'{k}="{v}"' for k, v in __labels.items()) + "}"
+
+
+def instrumented(backend: str):
+    # records every call of the decorated connector method in the connector's 'metrics'
+    def decorator(fn):
+        __method = fn.__name__.strip("_")
+
+        @functools.wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            with self.metrics.measure(backend, __method):
+                return fn(self, *args, **kwargs)
+        return wrapper
+    return decorator
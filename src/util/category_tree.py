@@ -0,0 +1,81 @@
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from semantha_sdk.model.document_class import DocumentClass
+
+
+# parent/child index over the document classes of a domain, ancestor paths are computed once per class - the tree is
+# shared between threads through the connector cache, so changes and the path memo are guarded by a lock
+class CategoryTree:
+
+    def __init__(self, categories: Iterable[DocumentClass] = ()):
+        self.__lock = threading.RLock()
+        self.__names: Dict[str, str] = {}
+        self.__parents: Dict[str, Optional[str]] = {}
+        self.__children: Dict[str, List[str]] = {}
+        self.__paths: Dict[str, Tuple[str, ...]] = {}
+        for category in categories:
+            self.add(category)
+        for category_id in list(self.__names):
+            self.get_path(category_id)
+
+    def __getstate__(self):
+        __state = self.__dict__.copy()
+        del __state["_CategoryTree__lock"]
+        return __state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__lock = threading.RLock()
+
+    def __contains__(self, category_id: str) -> bool:
+        return category_id in self.__names
+
+    def add(self, category: DocumentClass):
+        with self.__lock:
+            self.__add_node(category.id, category.name, category.parent_id)
+            for sub_class in category.sub_classes or []:
+                self.__add_node(sub_class.id, sub_class.name, sub_class.parent_id or category.id)
+
+    def get_name(self, category_id: str) -> str:
+        return self.__names[category_id]
+
+    def get_parent_id(self, category_id: str) -> Optional[str]:
+        return self.__parents.get(category_id)
+
+    def get_children(self, category_id: str) -> List[str]:
+        with self.__lock:
+            return list(self.__children.get(category_id, []))
+
+    def get_missing_ancestor(self, category_id: str) -> Optional[str]:
+        # first class id on the way up to the root that is not part of the tree yet
+        with self.__lock:
+            __current = category_id
+            while __current is not None:
+                if __current not in self.__names:
+                    return __current
+                __current = self.__parents[__current]
+            return None
+
+    def get_path(self, category_id: str) -> Tuple[str, ...]:
+        # ids from the root class down to (and including) the given class
+        with self.__lock:
+            if category_id not in self.__paths:
+                __parent_id = self.__parents[category_id]
+                if __parent_id is None or __parent_id not in self.__names:
+                    self.__paths[category_id] = (category_id,)
+                else:
+                    self.__paths[category_id] = self.get_path(__parent_id) + (category_id,)
+            return self.__paths[category_id]
+
+    def __add_node(self, category_id: str, name: str, parent_id: Optional[str]):
+        if category_id in self.__names and self.__parents[category_id] == parent_id:
+            return
+        if category_id in self.__parents and self.__parents[category_id] in self.__children:
+            self.__children[self.__parents[category_id]].remove(category_id)
+        self.__names[category_id] = name
+        self.__parents[category_id] = parent_id
+        if parent_id is not None:
+            self.__children.setdefault(parent_id, []).append(category_id)
+        # paths below the changed node are outdated
+        self.__paths.clear()
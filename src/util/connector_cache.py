@@ -0,0 +1,132 @@
+import logging
+import pickle
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class CacheStats:
+    __slots__ = ["hits", "misses", "evictions", "expirations", "entries", "bytes"]
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.entries = 0
+        self.bytes = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+# in-memory LRU cache for connector results, bounded by an (estimated) memory budget, with a ttl per method
+class ConnectorCache:
+
+    def __init__(self, max_bytes: int, ttls: Dict[str, float] = None, default_ttl: Optional[float] = None):
+        self.__max_bytes = max_bytes
+        self.__ttls = ttls or {}
+        self.__default_ttl = default_ttl
+        # (method, key) -> (value, size, expires_at)
+        self.__entries = OrderedDict()
+        self.__stats = {}
+        self.__bytes = 0
+        self.__lock = threading.Lock()
+
+    def get_or_compute(self, method: str, key: Hashable, compute: Callable[[], Any]) -> Any:
+        __found, __value = self.lookup(method, key)
+        if __found:
+            return __value
+        __value = compute()
+        self.put(method, key, __value)
+        return __value
+
+    def lookup(self, method: str, key: Hashable):
+        with self.__lock:
+            __stats = self.__stats_of(method)
+            __entry = self.__entries.get((method, key))
+            if __entry is not None and __entry[2] is not None and __entry[2] < time.monotonic():
+                self.__remove((method, key))
+                __stats.expirations += 1
+                __entry = None
+            if __entry is None:
+                __stats.misses += 1
+                return False, None
+            __stats.hits += 1
+            self.__entries.move_to_end((method, key))
+            return True, __entry[0]
+
+    def contains(self, method: str, key: Hashable) -> bool:
+        with self.__lock:
+            __entry = self.__entries.get((method, key))
+            return __entry is not None and (__entry[2] is None or __entry[2] >= time.monotonic())
+
+    def put(self, method: str, key: Hashable, value: Any):
+        __size = self.__estimate_size(value)
+        if __size > self.__max_bytes:
+            logging.info(f"Result of '{method}' ({__size} bytes) exceeds the cache budget, not caching it")
+            return
+        __ttl = self.__ttls.get(method, self.__default_ttl)
+        with self.__lock:
+            self.__remove((method, key))
+            self.__entries[(method, key)] = (value, __size, time.monotonic() + __ttl if __ttl is not None else None)
+            self.__bytes += __size
+            __stats = self.__stats_of(method)
+            __stats.entries += 1
+            __stats.bytes += __size
+            self.__evict()
+
+    def grow(self, method: str, key: Hashable, added: Any):
+        # sizes are measured on put, a value changed in place afterwards (e.g. a library index that got another
+        # document) grows by about the size of what was added - only that is measured
+        __size = self.__estimate_size(added)
+        with self.__lock:
+            __entry = self.__entries.get((method, key))
+            if __entry is None:
+                return
+            self.__entries[(method, key)] = (__entry[0], __entry[1] + __size, __entry[2])
+            self.__bytes += __size
+            self.__stats_of(method).bytes += __size
+            self.__evict()
+
+    def invalidate(self, *methods: str):
+        # without arguments the whole cache is cleared
+        with self.__lock:
+            for __entry_key in list(self.__entries):
+                if len(methods) == 0 or __entry_key[0] in methods:
+                    self.__remove(__entry_key)
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        with self.__lock:
+            return {method: stats.as_dict() for method, stats in self.__stats.items()}
+
+    def get_size(self) -> int:
+        return self.__bytes
+
+    def __stats_of(self, method: str) -> CacheStats:
+        if method not in self.__stats:
+            self.__stats[method] = CacheStats()
+        return self.__stats[method]
+
+    def __evict(self):
+        while self.__bytes > self.__max_bytes:
+            __oldest = next(iter(self.__entries))
+            self.__remove(__oldest)
+            self.__stats_of(__oldest[0]).evictions += 1
+
+    def __remove(self, entry_key):
+        __entry = self.__entries.pop(entry_key, None)
+        if __entry is not None:
+            self.__bytes -= __entry[1]
+            __stats = self.__stats_of(entry_key[0])
+            __stats.entries -= 1
+            __stats.bytes -= __entry[1]
+
+    @staticmethod
+    def __estimate_size(value: Any) -> int:
+        try:
+            return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        except Exception:
+            return sys.getsizeof(value)
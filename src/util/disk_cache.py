@@ -0,0 +1,72 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from typing import Optional
+
+
+# size-bounded file store, the least recently used files are evicted first (the mtime is bumped on every read)
+class DiskCache:
+
+    def __init__(self, directory: str, max_bytes: int, suffix: str = ""):
+        self.__directory = directory
+        self.__max_bytes = max_bytes
+        self.__suffix = suffix
+        self.__lock = threading.Lock()
+        os.makedirs(self.__directory, exist_ok=True)
+
+    def get_path(self, key: str) -> Optional[str]:
+        __path = self.__path_of(key)
+        try:
+            os.utime(__path)
+        except FileNotFoundError:
+            return None
+        return __path
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        __path = self.get_path(key)
+        if __path is None:
+            return None
+        try:
+            with open(__path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            # evicted in between
+            return None
+
+    def put_bytes(self, key: str, data: bytes) -> str:
+        __path = self.__path_of(key)
+        __fd, __tmp_path = tempfile.mkstemp(dir=self.__directory, suffix=".tmp")
+        with os.fdopen(__fd, "wb") as f:
+            f.write(data)
+        os.replace(__tmp_path, __path)
+        self.__evict()
+        return __path
+
+    def invalidate(self, key: str):
+        try:
+            os.remove(self.__path_of(key))
+        except FileNotFoundError:
+            pass
+
+    def __path_of(self, key: str) -> str:
+        return os.path.join(self.__directory, hashlib.sha256(key.encode("utf-8")).hexdigest() + self.__suffix)
+
+    def __evict(self):
+        with self.__lock:
+            __files = []
+            for entry in os.scandir(self.__directory):
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    __stat = entry.stat()
+                    __files.append((__stat.st_mtime, __stat.st_size, entry.path))
+            __total = sum(size for _, size, _ in __files)
+            for _, size, path in sorted(__files):
+                if __total <= self.__max_bytes:
+                    break
+                logging.info(f"Evicting '{path}' from disk cache '{self.__directory}'")
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                __total -= size
@@ -0,0 +1,6 @@
+# documents semantha can compare to the library
+ANALYZABLE_EXTENSIONS = (".pdf", ".txt", ".docx")
+
+
+def is_analyzable(path: str) -> bool:
+    return path.lower().endswith(ANALYZABLE_EXTENSIONS)
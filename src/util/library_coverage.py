@@ -0,0 +1,72 @@
+from typing import Dict, Iterable, List
+
+import numpy as np
+import pandas as pd
+
+from util.library_index import LibraryEntry, LibraryIndex
+
+COLLECTION_COLUMN = "Collection"
+
+
+# boolean matrix tag x library entry x input document: True where the document matched the entry and the entry has
+# the tag - answers per topic and per document which library entries are (not) covered without rescanning matches
+class LibraryCoverage:
+
+    def __init__(self, index: LibraryIndex, tags: List[str], matched_ids_per_document: Dict[str, Iterable[str]]):
+        self.__tags = list(tags)
+        self.__tag_positions = {t: i for i, t in enumerate(self.__tags)}
+        self.__documents = list(matched_ids_per_document)
+        self.__document_positions = {d: i for i, d in enumerate(self.__documents)}
+        __entries_per_tag = [index.get_entries_for_tag(t) for t in self.__tags]
+        self.__entries: List[LibraryEntry] = list({e.id: e for entries in __entries_per_tag for e in entries}.values())
+        __entry_positions = {e.id: i for i, e in enumerate(self.__entries)}
+
+        # entries of a tag are listed in library order
+        self.__positions_per_tag = [np.array([__entry_positions[e.id] for e in entries], dtype=np.int64)
+                                    for entries in __entries_per_tag]
+        __tag_entries = np.zeros((len(self.__tags), len(self.__entries)), dtype=bool)
+        for i, positions in enumerate(self.__positions_per_tag):
+            __tag_entries[i, positions] = True
+        __document_entries = np.zeros((len(self.__documents), len(self.__entries)), dtype=bool)
+        for i, doc_ids in enumerate(matched_ids_per_document.values()):
+            __document_entries[i, [__entry_positions[d] for d in set(doc_ids) if d in __entry_positions]] = True
+        self.__tag_entries = __tag_entries
+        self.__matrix = __tag_entries[:, :, np.newaxis] & __document_entries.T[np.newaxis, :, :]
+
+    @property
+    def tags(self) -> List[str]:
+        return self.__tags
+
+    @property
+    def documents(self) -> List[str]:
+        return self.__documents
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self.__matrix
+
+    def is_matched(self, tag: str, document: str = None) -> bool:
+        return bool(self.__matched_mask(tag, document).any())
+
+    def get_matched(self, tag: str, document: str = None) -> List[LibraryEntry]:
+        return self.__entries_of(tag, self.__matched_mask(tag, document))
+
+    def get_not_matched(self, tag: str, document: str = None) -> List[LibraryEntry]:
+        return self.__entries_of(tag, ~self.__matched_mask(tag, document))
+
+    def get_coverage(self) -> pd.DataFrame:
+        # share of the library entries of every tag matched per document and by the collection as a whole
+        __sizes = np.maximum(self.__tag_entries.sum(axis=1), 1)[:, np.newaxis]
+        __coverage = pd.DataFrame(self.__matrix.sum(axis=1) / __sizes, index=self.__tags, columns=self.__documents)
+        __coverage[COLLECTION_COLUMN] = self.__matrix.any(axis=2).sum(axis=1) / __sizes[:, 0]
+        return __coverage
+
+    def __matched_mask(self, tag: str, document: str = None) -> np.ndarray:
+        __matched = self.__matrix[self.__tag_positions[tag]]
+        if document is None:
+            return __matched.any(axis=1)
+        return __matched[:, self.__document_positions[document]]
+
+    def __entries_of(self, tag: str, mask: np.ndarray) -> List[LibraryEntry]:
+        __positions = self.__positions_per_tag[self.__tag_positions[tag]]
+        return [self.__entries[i] for i in __positions[mask[__positions]]]
@@ -0,0 +1,74 @@
+import threading
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from semantha_sdk.model.document_information import DocumentInformation
+from semantha_sdk.model.entity import Entity
+
+
+class LibraryEntry(NamedTuple):
+    id: str
+    name: str
+    content_preview: str
+
+
+# lookup tables for the reference library of a domain, filled once from a paged 'referencedocuments' listing - the
+# index is shared between threads through the connector cache and documents are added later, so changes and the
+# lookups over several tables are guarded by a lock
+class LibraryIndex:
+
+    def __init__(self, documents: Iterable[DocumentInformation] = ()):
+        self.__lock = threading.RLock()
+        self.__entries: Dict[str, LibraryEntry] = {}
+        self.__tags: Dict[str, Tuple[str, ...]] = {}
+        self.__categories: Dict[str, Entity] = {}
+        self.__entries_per_tag: Dict[str, List[str]] = {}
+        for doc in documents:
+            self.add(doc)
+
+    def __getstate__(self):
+        __state = self.__dict__.copy()
+        del __state["_LibraryIndex__lock"]
+        return __state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self.__entries
+
+    def add(self, doc: DocumentInformation):
+        # explicit tags first, derived tags afterwards - duplicates are dropped
+        __tags = tuple(dict.fromkeys((doc.tags or []) + (doc.derived_tags or [])))
+        with self.__lock:
+            if doc.id in self.__entries:
+                self.remove(doc.id)
+            self.__entries[doc.id] = LibraryEntry(doc.id, doc.name or "", doc.content_preview or "")
+            self.__tags[doc.id] = __tags
+            for tag in __tags:
+                self.__entries_per_tag.setdefault(tag, []).append(doc.id)
+            if doc.document_class is not None:
+                self.__categories[doc.id] = doc.document_class
+
+    def remove(self, doc_id: str):
+        with self.__lock:
+            self.__entries.pop(doc_id, None)
+            self.__categories.pop(doc_id, None)
+            for tag in self.__tags.pop(doc_id, ()):
+                self.__entries_per_tag[tag].remove(doc_id)
+
+    def get_entry(self, doc_id: str) -> Optional[LibraryEntry]:
+        return self.__entries.get(doc_id)
+
+    def get_tags(self, doc_id: str) -> List[str]:
+        return list(self.__tags.get(doc_id, ()))
+
+    def get_category(self, doc_id: str) -> Optional[Entity]:
+        return self.__categories.get(doc_id)
+
+    def get_entries_for_tag(self, tag: str) -> List[LibraryEntry]:
+        with self.__lock:
+            return [self.__entries[doc_id] for doc_id in self.__entries_per_tag.get(tag, [])]
@@ -0,0 +1,25 @@
+from io import BytesIO
+from typing import List
+
+from util.pdfium import pdfium
+
+
+def can_render_pdf_pages() -> bool:
+    # otherwise previews fall back to embedding the PDF itself
+    return pdfium is not None
+
+
+def render_pdf_pages(content: bytes, first_page: int = 0, page_count: int = 1, scale: float = 1.0,
+                     quality: int = 80) -> List[bytes]:
+    # JPEG thumbnails of the pages [first_page, first_page + page_count)
+    __pdf = pdfium.PdfDocument(content)
+    try:
+        __pages = []
+        for idx in range(first_page, min(first_page + page_count, len(__pdf))):
+            __image = __pdf[idx].render(scale=scale).to_pil().convert("RGB")
+            __buffer = BytesIO()
+            __image.save(__buffer, format="JPEG", quality=quality, optimize=True)
+            __pages.append(__buffer.getvalue())
+        return __pages
+    finally:
+        __pdf.close()
@@ -0,0 +1,42 @@
+from io import BytesIO
+from typing import List, NamedTuple
+
+from util.pdfium import pdfium
+
+
+class PdfChunk(NamedTuple):
+    first_page: int
+    page_count: int
+    content: bytes
+
+
+def can_split_pdf() -> bool:
+    # otherwise large documents are compared as a whole
+    return pdfium is not None
+
+
+def is_pdf(content: bytes) -> bool:
+    return content[:5] == b"%PDF-"
+
+
+def split_pdf(content: bytes, pages_per_chunk: int) -> List[PdfChunk]:
+    # page ranges of at most pages_per_chunk pages as PDFs of their own, a single chunk if the PDF is small enough
+    __pdf = pdfium.PdfDocument(content)
+    try:
+        __page_count = len(__pdf)
+        if __page_count <= pages_per_chunk:
+            return [PdfChunk(0, __page_count, content)]
+        __chunks = []
+        for first_page in range(0, __page_count, pages_per_chunk):
+            __pages = list(range(first_page, min(first_page + pages_per_chunk, __page_count)))
+            __chunk = pdfium.PdfDocument.new()
+            try:
+                __chunk.import_pages(__pdf, __pages)
+                __buffer = BytesIO()
+                __chunk.save(__buffer)
+            finally:
+                __chunk.close()
+            __chunks.append(PdfChunk(first_page, len(__pages), __buffer.getvalue()))
+        return __chunks
+    finally:
+        __pdf.close()
@@ -0,0 +1,5 @@
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    # a declared dependency, but missing after e.g. a bare pip install - PDFs are then handled as opaque files
+    pdfium = None
@@ -0,0 +1,66 @@
+from requests import Session
+from requests.adapters import HTTPAdapter
+from semantha_sdk.api.semantha_api import SemanthaAPI
+from semantha_sdk.request.semantha_request import SemanthaRequest
+from semantha_sdk.response.semantha_response import SemanthaPlatformResponse
+from semantha_sdk.rest.rest_client import RestClient
+
+from util.call_metrics import CallMetrics
+
+__PLATFORM_SERVER_API_VERSION = "v3"
+
+
+class _PooledSemanthaRequest:
+
+    def __init__(self, request: SemanthaRequest, session: Session, metrics: CallMetrics = None):
+        # the sdk only exposes the prepared request to its own execute(), which opens a new session per call
+        self.__prepared_request = request._SemanthaRequest__prepared_request
+        self.__session = session
+        self.__metrics = metrics
+
+    def execute(self) -> SemanthaPlatformResponse:
+        # requests prepared outside a session carry no Accept-Encoding header
+        self.__prepared_request.headers.setdefault("Accept-Encoding", "gzip, deflate")
+        __response = self.__session.send(self.__prepared_request)
+        if self.__metrics is not None:
+            self.__metrics.add_payload(len(self.__prepared_request.body or b""), len(__response.content))
+        return SemanthaPlatformResponse(__response)
+
+
+# RestClient that sends all requests through one keep-alive session with a connection pool of 'pool_size'
+class PooledRestClient(RestClient):
+
+    def __init__(self, server_url: str, api_key: str, pool_size: int = 10, metrics: CallMetrics = None):
+        super().__init__(server_url, api_key)
+        self.__metrics = metrics
+        self.__session = Session()
+        __adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.__session.mount("http://", __adapter)
+        self.__session.mount("https://", __adapter)
+
+    def get(self, *args, **kwargs):
+        return _PooledSemanthaRequest(super().get(*args, **kwargs), self.__session, self.__metrics)
+
+    def post(self, *args, **kwargs):
+        return _PooledSemanthaRequest(super().post(*args, **kwargs), self.__session, self.__metrics)
+
+    def delete(self, *args, **kwargs):
+        return _PooledSemanthaRequest(super().delete(*args, **kwargs), self.__session, self.__metrics)
+
+    def patch(self, *args, **kwargs):
+        return _PooledSemanthaRequest(super().patch(*args, **kwargs), self.__session, self.__metrics)
+
+    def put(self, *args, **kwargs):
+        return _PooledSemanthaRequest(super().put(*args, **kwargs), self.__session, self.__metrics)
+
+
+def login(server_url: str, key: str, pool_size: int = 10, metrics: CallMetrics = None) -> SemanthaAPI:
+    # same as semantha_sdk.login, but with a PooledRestClient
+    if not server_url.endswith("/tt-platform-server"):
+        server_url += "/tt-platform-server"
+    __api = SemanthaAPI(
+        PooledRestClient(server_url, key, pool_size, metrics), f"/api/{__PLATFORM_SERVER_API_VERSION}", "/api"
+    )
+    # check whether the API key is valid
+    __api.info.get()
+    return __api
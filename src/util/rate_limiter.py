@@ -0,0 +1,27 @@
+import threading
+import time
+
+
+# token bucket shared by all threads: at most 'rate' calls per second on average, bursts of up to 'burst' calls
+class RateLimiter:
+
+    def __init__(self, rate: float, burst: int = 1):
+        if rate <= 0:
+            raise ValueError(f"The rate must be greater than 0 calls per second, got {rate}")
+        self.__interval = 1.0 / rate
+        self.__burst = max(1, burst)
+        self.__tokens = float(self.__burst)
+        self.__updated = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.__lock:
+                __now = time.monotonic()
+                self.__tokens = min(self.__burst, self.__tokens + (__now - self.__updated) / self.__interval)
+                self.__updated = __now
+                if self.__tokens >= 1:
+                    self.__tokens -= 1
+                    return
+                __wait = (1 - self.__tokens) * self.__interval
+            time.sleep(__wait)
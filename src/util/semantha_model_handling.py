@@ -1,18 +1,265 @@
-from typing import Tuple, List
+import dataclasses
+import json
+import zlib
+from array import array
+from typing import Callable, Collection, Iterator, List, NamedTuple, Optional, Tuple
 
+import numpy as np
+import pandas as pd
 from semantha_sdk.model.document import Document
+from semantha_sdk.model.page import Page
 from semantha_sdk.model.paragraph import Paragraph
+from semantha_sdk.model.rect import Rect
 from semantha_sdk.model.reference import Reference
 
+MATCH_TABLE_COLUMNS = ["match", "page", "paragraph_id", "text", "rank", "document_id", "ref_paragraph_id",
+                       "similarity", "tags"]
 
-def get_paragraph_matches_of_doc(doc: Document) -> List[Tuple[Paragraph, List[Reference]]]:
-    __match_list = []
-    for page in doc.pages:
+
+def _iter_paragraphs_with_page(doc: Document) -> Iterator[Tuple[int, Paragraph]]:
+    for page_idx, page in enumerate(doc.pages or []):
         if page.contents is not None:
             for content in page.contents:
                 if content.paragraphs is not None:
                     for p in content.paragraphs:
-                        if p.references is not None and len(p.references) > 0:
-                            __match_list.append((p, p.references))
+                        yield page_idx, p
+
+
+def _iter_contents(doc: Document) -> Iterator[List[Paragraph]]:
+    for page in doc.pages or []:
+        if page.contents is not None:
+            for content in page.contents:
+                if content.paragraphs is not None:
+                    yield content.paragraphs
+
+
+def _iter_matches_with_page(doc) -> Iterator[Tuple[int, Paragraph]]:
+    # works on semantha documents as well as on compacted ones
+    if isinstance(doc, CompactDocument):
+        yield from doc.iter_matches_with_page()
+        return
+    for page_idx, p in _iter_paragraphs_with_page(doc):
+        if p.references is not None and len(p.references) > 0:
+            yield page_idx, p
+
+
+def get_paragraphs_of_doc(doc: Document) -> List[Paragraph]:
+    return [p for _, p in _iter_paragraphs_with_page(doc)]
+
+
+def get_paragraph_matches_of_doc(doc) -> List[Tuple[Paragraph, List[Reference]]]:
+    return [(p, p.references) for _, p in _iter_matches_with_page(doc)]
+
+
+def get_match_table(doc, tags_of: Callable[[str], List[str]], no_tag: str) -> pd.DataFrame:
+    # one row per reference, 'match' is the ordinal of the matched paragraph and 'rank' the position of the reference
+    __columns = {c: [] for c in MATCH_TABLE_COLUMNS}
+    __tags_per_doc = {}
+    __match_idx = 0
+    for page_idx, p in _iter_matches_with_page(doc):
+        for rank, ref in enumerate(p.references):
+            if ref.document_id not in __tags_per_doc:
+                __tags_per_doc[ref.document_id] = tuple(tags_of(ref.document_id) or [no_tag])
+            __columns["match"].append(__match_idx)
+            __columns["page"].append(page_idx)
+            __columns["paragraph_id"].append(p.id)
+            __columns["text"].append(p.text)
+            __columns["rank"].append(rank)
+            __columns["document_id"].append(ref.document_id)
+            __columns["ref_paragraph_id"].append(ref.paragraph_id)
+            __columns["similarity"].append(ref.similarity)
+            __columns["tags"].append(__tags_per_doc[ref.document_id])
+        __match_idx += 1
+    return pd.DataFrame({
+        "match": np.asarray(__columns["match"], dtype=np.int32),
+        "page": np.asarray(__columns["page"], dtype=np.int32),
+        "paragraph_id": pd.Series(__columns["paragraph_id"], dtype=object),
+        "text": pd.Series(__columns["text"], dtype=object),
+        "rank": np.asarray(__columns["rank"], dtype=np.int16),
+        "document_id": pd.Categorical(__columns["document_id"]),
+        "ref_paragraph_id": pd.Series(__columns["ref_paragraph_id"], dtype=object),
+        "similarity": np.asarray(__columns["similarity"], dtype=np.float64),
+        "tags": pd.Series(__columns["tags"], dtype=object),
+    })
+
+
+def filter_match_table_by_tags(table: pd.DataFrame, selected_tags: Collection[str]) -> pd.DataFrame:
+    if len(selected_tags) == 0:
+        return table
+    __hits = table["tags"].explode().isin(list(selected_tags)).groupby(level=0).any()
+    return table[__hits.reindex(table.index, fill_value=False)]
+
+
+def filter_match_table_by_similarity(table: pd.DataFrame, threshold: float) -> pd.DataFrame:
+    # references are sorted by similarity, so the kept ones of a paragraph keep their rank - the remaining matches
+    # are numbered again in document order
+    __kept = table[table["similarity"] >= threshold]
+    if len(__kept) == len(table):
+        return table
+    return __kept.assign(match=np.unique(__kept["match"].to_numpy(), return_inverse=True)[1].astype(np.int32))
+
+
+def get_top_matches(table: pd.DataFrame) -> pd.DataFrame:
+    # best reference per matched paragraph
+    return table[table["rank"] == 0]
+
+
+def _shift_areas(areas: Optional[List[Rect]], page_offset: int) -> Optional[List[Rect]]:
+    if areas is None or page_offset == 0:
+        return areas
+    return [dataclasses.replace(a, page=a.page + page_offset) if a.page is not None else a for a in areas]
+
+
+def _merge_paragraph(p: Paragraph, id_prefix: str, page_offset: int) -> Paragraph:
+    return dataclasses.replace(
+        p,
+        id=f"{id_prefix}{p.id}" if p.id is not None else None,
+        areas=_shift_areas(p.areas, page_offset),
+        sentences=None if p.sentences is None else [
+            dataclasses.replace(s, id=f"{id_prefix}{s.id}" if s.id is not None else None,
+                                areas=_shift_areas(s.areas, page_offset))
+            for s in p.sentences
+        ]
+    )
+
+
+def _merge_page(page: Page, id_prefix: str, page_offset: int) -> Page:
+    __annotation = page.annotation_page
+    if __annotation is not None and __annotation.page_number is not None:
+        __annotation = dataclasses.replace(__annotation, page_number=__annotation.page_number + page_offset)
+    return dataclasses.replace(
+        page,
+        contents=None if page.contents is None else [
+            dataclasses.replace(c, paragraphs=None if c.paragraphs is None else [
+                _merge_paragraph(p, id_prefix, page_offset) for p in c.paragraphs
+            ])
+            for c in page.contents
+        ],
+        paragraphs=None if page.paragraphs is None else [
+            _merge_paragraph(p, id_prefix, page_offset) for p in page.paragraphs
+        ],
+        annotation_page=__annotation
+    )
+
+
+def merge_documents(chunks: List[Tuple[int, int, Document]], name: str = None) -> Document:
+    # joins the comparisons of page ranges (first page, page count, document) of one document: the pages of every
+    # chunk start at its first page, and paragraph and sentence ids are prefixed with the chunk to stay unique - the
+    # document references of all chunks are merged as well
+    __chunks = sorted(chunks, key=lambda c: c[0])
+    __pages = []
+    for chunk_idx, (first_page, page_count, doc) in enumerate(__chunks):
+        if len(__pages) < first_page:
+            __pages.extend(Page(None, None, None, None) for _ in range(first_page - len(__pages)))
+        __prefix = f"{chunk_idx}:" if chunk_idx > 0 else ""
+        __pages.extend(_merge_page(page, __prefix, first_page) for page in doc.pages or [])
+        # semantha leaves out trailing pages without text
+        if len(__pages) < first_page + page_count:
+            __pages.extend(Page(None, None, None, None) for _ in range(first_page + page_count - len(__pages)))
+    __first = __chunks[0][2]
+    # every chunk is a comparison of its own
+    __ids = [doc.id for _, _, doc in __chunks if doc.id is not None]
+    return dataclasses.replace(
+        __first,
+        id="+".join(__ids) or None,
+        name=name or __first.name,
+        pages=__pages,
+        references=_merge_document_references([doc.references for _, _, doc in __chunks])
+    )
+
+
+def _merge_document_references(references: List[Optional[List[Reference]]]) -> Optional[List[Reference]]:
+    # one reference per library document, the most similar one of all chunks, sorted by similarity like semantha does
+    if all(r is None for r in references):
+        return None
+    __best = {}
+    for ref in (r for refs in references if refs is not None for r in refs):
+        __kept = __best.get(ref.document_id)
+        if __kept is None or (ref.similarity or 0) > (__kept.similarity or 0):
+            __best[ref.document_id] = ref
+    return sorted(__best.values(), key=lambda r: r.similarity or 0, reverse=True)
+
+
+# flat paragraph array of a document with the ordinal of every paragraph id
+class ParagraphIndex:
+
+    def __init__(self, doc: Document):
+        self.__paragraphs = []
+        self.__content_ends = []
+        for paragraphs in _iter_contents(doc):
+            self.__paragraphs.extend(paragraphs)
+            # exclusive end of the content block each paragraph belongs to
+            self.__content_ends.extend([len(self.__paragraphs)] * len(paragraphs))
+        self.__positions = {p.id: i for i, p in enumerate(self.__paragraphs)}
+
+    def __len__(self) -> int:
+        return len(self.__paragraphs)
+
+    def get_position(self, par_id: str) -> Optional[int]:
+        return self.__positions.get(par_id)
+
+    def get_paragraph(self, par_id: str) -> Optional[Paragraph]:
+        __pos = self.__positions.get(par_id)
+        return self.__paragraphs[__pos] if __pos is not None else None
+
+    def get_context_window(self, par_id: str, size: int = 3) -> List[Paragraph]:
+        # the paragraph, its successor within the same content block and the preceding paragraphs up to 'size'
+        __pos = self.__positions.get(par_id)
+        if __pos is None:
+            return []
+        __end = min(__pos + 2, self.__content_ends[__pos])
+        return self.__paragraphs[max(0, __end - size):__end]
+
+
+class CompactParagraph(NamedTuple):
+    id: str
+    text: str
+    references: Tuple[Reference, ...] = ()
+
+
+# analysis result that only keeps the matched paragraphs of a document, their references and the context windows
+# used for summaries - the windows are rarely read and therefore compressed by default
+class CompactDocument:
+    __slots__ = ["id", "name", "__pages", "__matches", "__positions", "__windows", "__compressed"]
+
+    def __init__(self, doc_id: str, name: str, pages: array, matches: Tuple[CompactParagraph, ...],
+                 windows: Tuple[bytes, ...], compressed: bool):
+        self.id = doc_id
+        self.name = name
+        self.__pages = pages
+        self.__matches = matches
+        self.__positions = {m.id: i for i, m in enumerate(matches)}
+        self.__windows = windows
+        self.__compressed = compressed
+
+    @classmethod
+    def from_document(cls, doc: Document, window_size: int = 3, compress: bool = True) -> "CompactDocument":
+        __index = ParagraphIndex(doc)
+        __pages = array("i")
+        __matches = []
+        __windows = []
+        for page_idx, p in _iter_matches_with_page(doc):
+            __pages.append(page_idx)
+            # the context of a reference is only needed by the semantha ui
+            __matches.append(CompactParagraph(
+                p.id, p.text, tuple(dataclasses.replace(r, context=None) for r in p.references)
+            ))
+            __window = json.dumps([[w.id, w.text] for w in __index.get_context_window(p.id, window_size)])
+            __windows.append(zlib.compress(__window.encode("utf-8")) if compress else __window.encode("utf-8"))
+        return cls(doc.id, doc.name, __pages, tuple(__matches), tuple(__windows), compress)
+
+    def __len__(self) -> int:
+        return len(self.__matches)
+
+    def iter_matches_with_page(self) -> Iterator[Tuple[int, CompactParagraph]]:
+        return zip(self.__pages, self.__matches)
 
-    return __match_list
+    def get_context_window(self, par_id: str) -> List[CompactParagraph]:
+        # the window is fixed when the document is compacted, only matched paragraphs have one
+        __pos = self.__positions.get(par_id)
+        if __pos is None:
+            return []
+        __window = self.__windows[__pos]
+        if self.__compressed:
+            __window = zlib.decompress(__window)
+        return [CompactParagraph(i, t) for i, t in json.loads(__window.decode("utf-8"))]
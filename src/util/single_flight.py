@@ -0,0 +1,51 @@
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+
+class _Flight:
+    __slots__ = ["done", "result", "error"]
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+# concurrent calls with the same key share the execution (and the result or error) of the first caller
+class SingleFlight:
+
+    def __init__(self):
+        self.__flights = {}
+        self.__lock = threading.Lock()
+        self.__calls = 0
+        self.__coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self.__lock:
+            __flight = self.__flights.get(key)
+            __leader = __flight is None
+            if __leader:
+                __flight = _Flight()
+                self.__flights[key] = __flight
+                self.__calls += 1
+            else:
+                self.__coalesced += 1
+        if not __leader:
+            __flight.done.wait()
+            if __flight.error is not None:
+                raise __flight.error
+            return __flight.result
+        try:
+            __flight.result = fn()
+            return __flight.result
+        except BaseException as e:
+            __flight.error = e
+            raise
+        finally:
+            with self.__lock:
+                del self.__flights[key]
+            __flight.done.set()
+
+    def get_stats(self) -> Dict[str, int]:
+        with self.__lock:
+            return {"calls": self.__calls, "coalesced": self.__coalesced, "in_flight": len(self.__flights)}
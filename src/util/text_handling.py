@@ -3,3 +3,16 @@ def short_text(text: str, threshold: int = 10) -> str:
         return text[:threshold] + "..."
     else:
         return text
+
+
+def human_readable_size(num_bytes: int) -> str:
+    for unit in ["B", "KB", "MB"]:
+        if num_bytes < 1024:
+            return f"{num_bytes:.0f} {unit}"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f} GB"
+
+
+def normalize_question(question: str) -> str:
+    # questions that only differ in case, spacing or closing punctuation share their answer
+    return " ".join(question.casefold().split()).rstrip("?!. ")
@@ -0,0 +1,10 @@
+import pytest
+
+from fake_semantha import FakeSemanthaServer
+
+
+@pytest.fixture
+def semantha_server():
+    __server = FakeSemanthaServer(library_size=20).start()
+    yield __server
+    __server.stop()
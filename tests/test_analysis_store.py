@@ -0,0 +1,75 @@
+from array import array
+
+from util.analysis_store import AnalysisStore, ManifestEntry, analysis_parameters
+from util.semantha_model_handling import CompactDocument
+
+__PARAMETERS = analysis_parameters(0.7, 1, 0, "(20, 1600000019)")
+
+
+def _document(doc_id: str) -> CompactDocument:
+    return CompactDocument(doc_id, f"{doc_id}.pdf", array("i"), (), (), True)
+
+
+def _store(tmp_path) -> AnalysisStore:
+    return AnalysisStore(str(tmp_path), 64 * 1024 * 1024)
+
+
+def test_stored_results_are_reused_for_the_same_file_and_parameters(tmp_path):
+    __store = _store(tmp_path)
+    __store.put("scope", "a.pdf", "md5", "2023-06-01", __PARAMETERS, _document("a"))
+    assert __store.get("scope", "a.pdf", "md5", "2023-06-01", __PARAMETERS).id == "a"
+    assert __store.get("other scope", "a.pdf", "md5", "2023-06-01", __PARAMETERS) is None
+    assert __store.get("scope", "a.pdf", "changed", "2023-06-01", __PARAMETERS) is None
+    assert __store.get("scope", "a.pdf", "md5", "2023-06-02", __PARAMETERS) is None
+
+
+def test_parameters_contain_the_comparison_settings_and_the_library_state():
+    __parameters = {
+        analysis_parameters(0.7, 1, 0, "(20, 1600000019)"),
+        analysis_parameters(0.8, 1, 0, "(20, 1600000019)"),
+        analysis_parameters(0.7, 3, 0, "(20, 1600000019)"),
+        analysis_parameters(0.7, 1, 50, "(20, 1600000019)"),
+        analysis_parameters(0.7, 1, 0, "(21, 1600000020)")
+    }
+    assert len(__parameters) == 5
+
+
+def test_a_library_change_invalidates_the_manifest_entries(tmp_path):
+    __store = _store(tmp_path)
+    __store.put("scope", "a.pdf", "md5", None, __PARAMETERS, _document("a"))
+    __store.save()
+    __changed = analysis_parameters(0.7, 1, 0, "(20, 1600000020)")
+    assert _store(tmp_path).get("scope", "a.pdf", "md5", None, __changed) is None
+    assert _store(tmp_path).get("scope", "a.pdf", "md5", None, __PARAMETERS).id == "a"
+
+
+def test_saves_of_several_stores_are_merged(tmp_path):
+    __app = _store(tmp_path)
+    __batch = _store(tmp_path)
+    __app.put("scope", "a.pdf", "md5-a", None, __PARAMETERS, _document("a"))
+    __batch.put("scope", "b.pdf", "md5-b", None, __PARAMETERS, _document("b"))
+    __app.save()
+    __batch.save()
+    assert _store(tmp_path).get_manifest("scope") == {
+        "a.pdf": ManifestEntry("md5-a", None, __PARAMETERS),
+        "b.pdf": ManifestEntry("md5-b", None, __PARAMETERS)
+    }
+
+
+def test_saves_of_others_are_picked_up(tmp_path):
+    __app = _store(tmp_path)
+    __app.put("scope", "a.pdf", "md5-a", None, __PARAMETERS, _document("a"))
+    __batch = _store(tmp_path)
+    __batch.put("scope", "b.pdf", "md5-b", None, __PARAMETERS, _document("b"))
+    __batch.save()
+    # unsaved entries of the app are kept
+    assert set(__app.get_manifest("scope")) == {"a.pdf", "b.pdf"}
+    assert __app.get("scope", "b.pdf", "md5-b", None, __PARAMETERS).id == "b"
+
+
+def test_results_are_only_listed_after_save(tmp_path):
+    __store = _store(tmp_path)
+    __store.put("scope", "a.pdf", "md5", None, __PARAMETERS, _document("a"))
+    assert _store(tmp_path).get_manifest("scope") == {}
+    __store.save()
+    assert set(_store(tmp_path).get_manifest("scope")) == {"a.pdf"}
@@ -0,0 +1,27 @@
+import pyarrow.parquet as pq
+
+import batch_analysis
+
+
+def _run(directory, secrets, output) -> int:
+    return batch_analysis.main(["--directory", str(directory), "--secrets", str(secrets), "--output", str(output),
+                                "--workers", "1", "--incremental"])
+
+
+def test_incremental_run_analyzes_again_after_a_library_change(semantha_server, tmp_path):
+    __documents = tmp_path / "documents"
+    __documents.mkdir()
+    (__documents / "report.txt").write_text("bench-paragraphs=12")
+    __secrets = tmp_path / "secrets.toml"
+    __secrets.write_text(f'[semantha]\nserver_url = "{semantha_server.url}"\napi_key = "key"\ndomain = "domain"\n\n'
+                         f'[cache]\ndir = "{tmp_path / "cache"}"\n')
+
+    assert _run(__documents, __secrets, tmp_path / "first.parquet") == 0
+    assert _run(__documents, __secrets, tmp_path / "unchanged.parquet") == 0
+    assert semantha_server.get_calls()["POST references"] == 1
+    assert pq.read_table(tmp_path / "unchanged.parquet").equals(pq.read_table(tmp_path / "first.parquet"))
+
+    # neither the stored analysis nor the cached comparison of the document may be reused
+    semantha_server.update_library_document("lib-3")
+    assert _run(__documents, __secrets, tmp_path / "changed.parquet") == 0
+    assert semantha_server.get_calls()["POST references"] == 2
@@ -0,0 +1,80 @@
+import pytest
+
+from util import connector_cache
+from util.connector_cache import ConnectorCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    __now = [1000.0]
+    monkeypatch.setattr(connector_cache.time, "monotonic", lambda: __now[0])
+    return __now
+
+
+def test_values_are_computed_once_per_method_and_key():
+    __cache = ConnectorCache(1024 * 1024)
+    __calls = []
+    for method, key in [("tags", ()), ("tags", ()), ("category", ("a",)), ("category", ("b",)), ("tags", ("a",))]:
+        __cache.get_or_compute(method, key, lambda: __calls.append((method, key)) or len(__calls))
+    assert __calls == [("tags", ()), ("category", ("a",)), ("category", ("b",)), ("tags", ("a",))]
+    assert __cache.get_stats()["tags"]["hits"] == 1
+
+
+def test_entries_expire_after_their_ttl(clock):
+    __cache = ConnectorCache(1024 * 1024, {"answer": 60}, default_ttl=None)
+    __cache.put("answer", ("question",), "answer")
+    __cache.put("tags", (), ["tag"])
+    clock[0] += 59
+    assert __cache.lookup("answer", ("question",)) == (True, "answer")
+    clock[0] += 2
+    assert not __cache.contains("answer", ("question",))
+    assert __cache.lookup("answer", ("question",)) == (False, None)
+    assert __cache.get_stats()["answer"]["expirations"] == 1
+    # without a ttl entries only leave the cache when evicted
+    assert __cache.lookup("tags", ()) == (True, ["tag"])
+
+
+def test_least_recently_used_entries_are_evicted_over_the_budget():
+    __value = "x" * 100
+    __cache = ConnectorCache(3 * len(__value) + 100)
+    for key in ["a", "b", "c"]:
+        __cache.put("paragraphs", (key,), __value)
+    __cache.lookup("paragraphs", ("a",))
+    __cache.put("paragraphs", ("d",), __value)
+    assert [k for k in "abcd" if __cache.contains("paragraphs", (k,))] == ["a", "c", "d"]
+    assert __cache.get_stats()["paragraphs"]["evictions"] == 1
+    assert __cache.get_size() <= 3 * len(__value) + 100
+
+
+def test_values_over_the_budget_are_not_cached():
+    __cache = ConnectorCache(100)
+    __cache.put("index", (), "x" * 1000)
+    assert not __cache.contains("index", ())
+    assert __cache.get_size() == 0
+
+
+def test_grow_adds_the_size_of_the_added_part_and_evicts():
+    __cache = ConnectorCache(1000)
+    __cache.put("tags", (), ["tag"])
+    __cache.put("index", (), {})
+    __size = __cache.get_size()
+    __cache.grow("index", (), "x" * 300)
+    assert __cache.get_size() > __size + 300
+    __cache.grow("index", (), "x" * 700)
+    # the older entry goes first
+    assert not __cache.contains("tags", ())
+    assert __cache.get_size() <= 1000
+    __cache.grow("missing", (), "x" * 300)
+
+
+def test_invalidate_removes_the_entries_of_the_given_methods():
+    __cache = ConnectorCache(1024 * 1024)
+    __cache.put("index", (), {})
+    __cache.put("answer", ("question",), "answer")
+    __cache.put("summary", ("topic",), "summary")
+    __cache.invalidate("index", "answer")
+    assert not __cache.contains("index", ())
+    assert not __cache.contains("answer", ("question",))
+    assert __cache.contains("summary", ("topic",))
+    __cache.invalidate()
+    assert __cache.get_size() == 0
@@ -0,0 +1,49 @@
+import os
+
+from util.disk_cache import DiskCache
+
+
+def _age(cache: DiskCache, key: str, seconds: float):
+    __path = cache.get_path(key)
+    __mtime = os.path.getmtime(__path) - seconds
+    os.utime(__path, (__mtime, __mtime))
+
+
+def test_keys_are_stored_separately(tmp_path):
+    __cache = DiskCache(str(tmp_path), 1024)
+    __cache.put_bytes("document|domain|0.7", b"first")
+    __cache.put_bytes("document|domain|0.8", b"second")
+    assert __cache.get_bytes("document|domain|0.7") == b"first"
+    assert __cache.get_bytes("document|domain|0.8") == b"second"
+    assert __cache.get_bytes("document|domain|0.9") is None
+
+
+def test_put_replaces_the_value_of_a_key(tmp_path):
+    __cache = DiskCache(str(tmp_path), 1024)
+    __cache.put_bytes("key", b"old")
+    __cache.put_bytes("key", b"new")
+    assert __cache.get_bytes("key") == b"new"
+    assert len(os.listdir(tmp_path)) == 1
+
+
+def test_least_recently_used_files_are_evicted_over_the_budget(tmp_path):
+    __cache = DiskCache(str(tmp_path), 250)
+    for key in ["a", "b"]:
+        __cache.put_bytes(key, b"x" * 100)
+    _age(__cache, "a", 20)
+    _age(__cache, "b", 10)
+    # reading 'a' makes 'b' the least recently used file
+    __cache.get_bytes("a")
+    __cache.put_bytes("c", b"x" * 100)
+    assert __cache.get_bytes("a") is not None
+    assert __cache.get_bytes("b") is None
+    assert __cache.get_bytes("c") is not None
+
+
+def test_invalidate_removes_a_key(tmp_path):
+    __cache = DiskCache(str(tmp_path), 1024, suffix=".pdf")
+    __cache.put_bytes("key", b"value")
+    assert __cache.get_path("key").endswith(".pdf")
+    __cache.invalidate("key")
+    __cache.invalidate("missing")
+    assert __cache.get_bytes("key") is None
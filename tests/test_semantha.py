@@ -0,0 +1,40 @@
+from io import BytesIO
+
+from semantha import SemanthaConnector
+from util.disk_cache import DiskCache
+
+__DOCUMENT = b"bench-paragraphs=12"
+
+
+def _connect(server, result_cache: DiskCache, monkeypatch) -> SemanthaConnector:
+    # the library is checked for changes on every call
+    monkeypatch.setattr(SemanthaConnector, "_SemanthaConnector__LIBRARY_CHECK_INTERVAL", 0)
+    return SemanthaConnector(server.url, "key", "domain", result_cache)
+
+
+def test_compare_is_served_from_the_result_cache(semantha_server, tmp_path, monkeypatch):
+    __cache = DiskCache(str(tmp_path), 64 * 1024 * 1024)
+    __first = _connect(semantha_server, __cache, monkeypatch).compare_to_library(BytesIO(__DOCUMENT), 0.7)
+    # a new connector only shares the disk cache
+    __second = _connect(semantha_server, __cache, monkeypatch).compare_to_library(BytesIO(__DOCUMENT), 0.7)
+    assert semantha_server.get_calls()["POST references"] == 1
+    assert __second.id == __first.id
+
+
+def test_compare_key_contains_the_comparison_settings(semantha_server, tmp_path, monkeypatch):
+    __connector = _connect(semantha_server, DiskCache(str(tmp_path), 64 * 1024 * 1024), monkeypatch)
+    __connector.compare_to_library(BytesIO(__DOCUMENT), 0.7)
+    __connector.compare_to_library(BytesIO(__DOCUMENT), 0.8)
+    __connector.compare_to_library(BytesIO(__DOCUMENT), 0.7, max_references=3)
+    __connector.compare_to_library(BytesIO(__DOCUMENT + b" "), 0.7)
+    assert semantha_server.get_calls()["POST references"] == 4
+
+
+def test_library_change_misses_the_result_cache(semantha_server, tmp_path, monkeypatch):
+    __connector = _connect(semantha_server, DiskCache(str(tmp_path), 64 * 1024 * 1024), monkeypatch)
+    __connector.compare_to_library(BytesIO(__DOCUMENT), 0.7)
+    __connector.compare_to_library(BytesIO(__DOCUMENT), 0.7)
+    assert semantha_server.get_calls()["POST references"] == 1
+    semantha_server.update_library_document("lib-3")
+    __connector.compare_to_library(BytesIO(__DOCUMENT), 0.7)
+    assert semantha_server.get_calls()["POST references"] == 2